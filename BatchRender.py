@@ -0,0 +1,82 @@
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Only the core audio modules are imported here so render jobs never load the GUI stack (PyQt, matplotlib)
+from ScoreManager import ScoreManager, DEFAULT_BLOCK_SIZE
+from Envelope import Envelope
+from Effects import Delay, Reverb
+from WavWriter import SAMPLE_FORMATS
+
+# Command line batch renderer: renders many score files to wav files with a pool of worker processes
+# Example: python BatchRender.py MusicScore.txt MyChords.txt --tempo 120 --envelope 200 50 0.5 200 --delay 100 5 0.5 0.5 -o renders
+
+# Render one score file to a wav file (outputFile without the .wav extension) and return the time taken in secs
+def renderScoreFile(scoreFile, outputFile, settings):
+	startTime = time.time()
+	envelope = Envelope(*settings["envelope"]) if settings["envelope"] else Envelope()
+	sm = ScoreManager(settings["tempo"], envelope, settings["envelope"] is not None)
+	sm.readScore(scoreFile)
+
+	effects = []
+	if settings["delay"]:
+		effects.append(Delay(*settings["delay"], extendTail = settings["tail"]))
+	if settings["reverb"]:
+		effects.append(Reverb(reverbTime = settings["reverb"][0], mix = settings["reverb"][1], extendTail = settings["tail"]))
+
+	# Rendered block by block straight to disk so memory use does not grow with the score
+	sm.writeSoundToFile(outputFile, settings["blockSize"], effects, settings["format"])
+	return time.time() - startTime
+
+def parseArguments(argv):
+	parser = argparse.ArgumentParser(description = "Render score files to wav files without the GUI")
+	parser.add_argument("scores", nargs = "+", help = "score files to render")
+	parser.add_argument("-o", "--output-dir", default = ".", help = "directory for the wav files (default: current directory)")
+	parser.add_argument("-t", "--tempo", type = int, default = 100, help = "tempo in beats per minute (default: 100)")
+	parser.add_argument("--envelope", type = float, nargs = 4, metavar = ("A", "D", "S", "R"), help = "apply an ADSR envelope: attack (ms), decay (ms), sustain (0-1), release (ms)")
+	parser.add_argument("--delay", type = float, nargs = 4, metavar = ("TIME", "REPEATS", "MIX", "DECAY"), help = "apply a delay: delay time (ms), repetitions, mix (0-1), decay (0-1)")
+	parser.add_argument("--reverb", type = float, nargs = 2, metavar = ("TIME", "MIX"), help = "apply a reverb: reverb time (ms), mix (0-1)")
+	parser.add_argument("--tail", action = "store_true", help = "keep the delay and reverb tails after the end of the score")
+	parser.add_argument("-f", "--format", default = "int16", choices = sorted(SAMPLE_FORMATS.keys()), help = "sample format of the wav files (default: int16)")
+	parser.add_argument("-b", "--block-size", type = int, default = DEFAULT_BLOCK_SIZE, help = "number of samples rendered at once (default: %d)" % DEFAULT_BLOCK_SIZE)
+	parser.add_argument("-j", "--workers", type = int, default = os.cpu_count() or 1, help = "number of worker processes (default: number of cores)")
+	return parser.parse_args(argv)
+
+def main(argv = None):
+	args = parseArguments(argv)
+	settings = {
+		"tempo"     : args.tempo,
+		"envelope"  : args.envelope,
+		"delay"     : (args.delay[0], int(args.delay[1]), args.delay[2], args.delay[3]) if args.delay else None,
+		"reverb"    : args.reverb,
+		"tail"      : args.tail,
+		"format"    : args.format,
+		"blockSize" : args.block_size,
+	}
+	if not os.path.isdir(args.output_dir):
+		os.makedirs(args.output_dir)
+
+	startTime = time.time()
+	failures = 0
+	with ProcessPoolExecutor(max(args.workers, 1)) as pool:
+		jobs = []
+		for scoreFile in args.scores:
+			outputFile = os.path.join(args.output_dir, os.path.splitext(os.path.basename(scoreFile))[0])
+			jobs.append((scoreFile, outputFile, pool.submit(renderScoreFile, scoreFile, outputFile, settings)))
+
+		# Report every file in the order given, with its own render time
+		for scoreFile, outputFile, job in jobs:
+			try:
+				renderTime = job.result()
+				print("OK     %8.3fs  %s -> %s.wav" % (renderTime, scoreFile, outputFile))
+			except Exception as e:
+				failures += 1
+				print("FAILED           %s: %s" % (scoreFile, e), file = sys.stderr)
+
+	print("Rendered %d of %d scores in %.3fs" % (len(args.scores) - failures, len(args.scores), time.time() - startTime))
+	return 1 if failures else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -1,51 +1,291 @@
 import numpy as np
-from scipy.io.wavfile import write
-from math import pi, sin, floor
-from fractions import gcd
+import hashlib
 
 from SoundGenerator import SoundGenerator
-from UtilityFunctions import *
+from UtilityFunctions import SAMPLE_RATE, CLIP_HARD, clipSound, convertTimeToSampleCount, limitAmplitude
+from NoteCache import NoteCache
+from TimelineIndex import mergeRanges
+
+# Maximum number of repetitions of a delay (matches the range offered in the GUI)
+MAX_DELAY_REPETITIONS = 20
 
 # Implements a delay effect
 # Delay time  - Delay in msecs between each different delay 
 # repetitions - Total number of additonal delays
 # mix         - Weight given to original signal vs delay signal
 #decay        - Controls the attrituion of  repetition volume in time (1.0: Full Attrition , 0.0: No Attrition )
+#extendTail   - Make the output longer than the original sound so the last repetitions are not cut off
 class Delay():
-	def __init__(self, delayTime = 1000.0, repetitions = 3, mix = 1.0, decay = 1.0):
-		self.repetitions = min(repetitions, 10)
+	def __init__(self, delayTime = 1000.0, repetitions = 3, mix = 1.0, decay = 1.0, extendTail = False, clipMode = CLIP_HARD):
+		self.repetitions = int(min(repetitions, MAX_DELAY_REPETITIONS))
 		self.delayTime   = float(delayTime)
 		self.mix = mix
 		self.delayInSampleCount = convertTimeToSampleCount(self.delayTime)
 		self.decay = float(max(limitAmplitude(decay), 0.0))
+		self.extendTail = extendTail
+		self.clipMode = clipMode
+		self.reset()
 		
-		
+	# Decay coefficents(weigths) for each repetition of decay
+	# (If decay = 0, they are all the same
+	# (If decay = 1, they are samples of linearly decreasing curve from 1.0 to 0.0)
+	def getDecayCoefficients(self):
+		return np.linspace(1.0, (1 - self.decay), self.repetitions + 1)[1:]
+
+	# Number of samples the repetitions last after the end of the original sound
+	def getTailLength(self):
+		return self.delayInSampleCount * self.repetitions
+
+	# Weights of original sound and delayed sound based on mix value
+	def getGains(self):
+		return (max(limitAmplitude(1 - self.mix), 0.0), max(limitAmplitude(self.mix), 0.0))
+
+	# Forget the sound of previously processed blocks
+	def reset(self):
+		self.history = np.zeros(self.getTailLength())
+
+	# Apply the delay to the next block of a sound and return the processed block
+	# The last delay time x repetitions samples are remembered for the repetitions landing in the following blocks
+	def processBlock(self, block):
+		dryGain, wetGain = self.getGains()
+		historyLength = len(self.history)
+		blockLength   = len(block)
+		extended      = np.concatenate((self.history, block))
+
+		newBlock = block * dryGain
+		scratch  = np.empty(blockLength)
+		for r, coeff in enumerate(self.getDecayCoefficients(), 1):
+			start = historyLength - r * self.delayInSampleCount
+			newBlock += np.multiply(extended[start:start + blockLength], wetGain * coeff, out = scratch)
+
+		self.history = extended[blockLength:]
+		return clipSound(newBlock, self.clipMode, out = newBlock)
+
 	def generateDelayedSound(self, soundObj):
-		
-		# Initial black sound for delayed sound
-		delayedSound  = SoundGenerator(waveType = "Constant", frequency = 5, amplitude = 0.0, duration = soundObj.getDuration())
-		# Initial black sound for delayed sound
-		originalSound = SoundGenerator(waveType = "Constant", frequency = 5, amplitude = 0.0, duration = soundObj.getDuration())
-		# Copy into new variable to avoid accidental modification of original sound
-		originalSound.setSound(np.copy(soundObj.getSound()))
-		
-		# Decay coefficents(weigths) for each repetition of decay
-		# (If decay = 0, they are all the same
-		# (If decay = 1, they are samples of linearly decreasing curve from 1.0 to 0.0)
-		decayCoeffs = np.linspace(1.0, (1 - self.decay), self.repetitions + 1)[1:]
-		
-		# For each repetition
-		for r in range(1, self.repetitions + 1):
-			# Create copy of original sound
-			originalSoundCopy = SoundGenerator(waveType = "Constant", frequency = 5, amplitude = 0.0, duration = soundObj.getDuration())
-			originalSoundCopy.setSound(np.copy(soundObj.getSound()))
-			
-			# Genrate sound shifted by delayTime * repetition number
-			individualDelay = originalSoundCopy.shiftBy(self.delayInSampleCount * r)
-			
-			# Superimpose with existing delay sound
-			delayedSound = delayedSound  + (individualDelay * decayCoeffs[r - 1])
-		
-		# Return weighted average of orginal sound and delayed sound based on mix value
-		return (originalSound * (1-self.mix)) + (delayedSound * self.mix)
-		
+		sound  = soundObj.getSound()
+		length = len(sound) + (self.getTailLength() if self.extendTail else 0)
+
+		# Weights of original sound and delayed sound based on mix value
+		dryGain, wetGain = self.getGains()
+
+		# Superimpose original sound on the weighted repetitions and limit the result once
+		newSound = self.getRepetitions(sound, length)
+		newSound *= wetGain
+		newSound[:len(sound)] += dryGain * sound
+		clipSound(newSound, self.clipMode, out = newSound)
+
+		delayedSoundObj = SoundGenerator(waveType = "Combination", frequency = soundObj.getFrequency(), amplitude = np.max(newSound) if length > 0 else 0.0, duration = float(length) / SAMPLE_RATE, clipMode = self.clipMode)
+		delayedSoundObj.setSound(newSound)
+		return delayedSoundObj
+
+	# Sum of all weighted repetitions of sound (without the original), for the first length samples
+	# Computed in a single pass whatever the number of repetitions:
+	# The sound is folded into rows of one delay time so repetition r of row j lands on row j + r
+	# As the weights fall linearly (c_r = 1 - step * r) the weighted sum of the last repetitions rows
+	# is obtained from two running sums over the rows: sum(X[j]) and sum(j * X[j])
+	def getRepetitions(self, sound, length):
+		delay = self.delayInSampleCount
+		if self.repetitions == 0 or length == 0:
+			return np.zeros(length)
+		if delay == 0:
+			# Every repetition lands on the original sound
+			repetitions = np.zeros(length)
+			repetitions[:len(sound)] = sound[:length] * np.sum(self.getDecayCoefficients())
+			return repetitions
+
+		rowCount = -(-length // delay)
+		step     = self.decay / self.repetitions
+
+		# Running sums over rows, row k holds the sum of rows 0 to k - 1
+		rowSums      = np.zeros((rowCount + 1, delay))
+		indexSums    = np.zeros((rowCount + 1, delay))
+		folded       = rowSums[1:].reshape(-1)
+		copyCount    = min(len(sound), len(folded))
+		folded[:copyCount] = sound[:copyCount]
+		rowIndex     = np.arange(rowCount)[:, None]
+		np.multiply(rowSums[1:], rowIndex, out = indexSums[1:])
+		np.cumsum(rowSums[1:], axis = 0, out = rowSums[1:])
+		np.cumsum(indexSums[1:], axis = 0, out = indexSums[1:])
+
+		# Window of the previous repetitions rows for every row
+		firstRow     = np.maximum(np.arange(rowCount) - self.repetitions, 0)
+		repetitions  = rowSums[:rowCount] - rowSums[firstRow]
+		repetitions *= 1 - step * rowIndex
+		windowIndex  = indexSums[:rowCount] - indexSums[firstRow]
+		windowIndex *= step
+		repetitions += windowIndex
+		return repetitions.reshape(-1)[:length]
+
+# Memory budget of the cache of impulse response spectra shared by all reverbs
+REVERB_CACHE_BYTES = 32 * 1024 * 1024
+
+# FFT of impulse responses keyed on (impulse response digest, FFT size)
+impulseSpectrumCache = NoteCache(REVERB_CACHE_BYTES)
+
+# Generate an impulse response: white noise decaying exponentially to -60dB over reverbTime msecs
+# The noise is seeded so the same reverb time always gives the same impulse response
+def generateImpulseResponse(reverbTime = 1500.0, seed = 0):
+	sampleCount = max(convertTimeToSampleCount(reverbTime), 1)
+	noise = np.random.RandomState(seed).uniform(-1, 1, sampleCount)
+	noise *= np.exp(np.arange(sampleCount) * (-6.9 / sampleCount))
+	return normalizeImpulseResponse(noise)
+
+# Read an impulse response from a WAV file
+# Integer samples are scaled to -1.0 to 1.0, channels are averaged and the sampling rate is converted to SAMPLE_RATE
+def loadImpulseResponse(filename):
+	# scipy is only loaded when a file is actually read, it is too slow to import on every start
+	from scipy.io.wavfile import read
+	rate, data = read(filename)
+	if np.issubdtype(data.dtype, np.integer):
+		info = np.iinfo(data.dtype)
+		data = (data.astype(np.float64) - (info.max + info.min + 1) / 2.0) / ((info.max - info.min + 1) / 2.0)
+	data = np.asarray(data, dtype = np.float64)
+	if data.ndim > 1:
+		data = data.mean(axis = 1)
+	if rate != SAMPLE_RATE and len(data) > 1:
+		sampleCount = max(int(len(data) * float(SAMPLE_RATE) / rate), 1)
+		data = np.interp(np.arange(sampleCount) * (float(rate) / SAMPLE_RATE), np.arange(len(data)), data)
+	return normalizeImpulseResponse(data)
+
+# Scale an impulse response to unit energy so the reverberated sound keeps roughly the loudness of the original
+def normalizeImpulseResponse(impulseResponse):
+	energy = np.sqrt(np.sum(impulseResponse ** 2))
+	if energy > 0:
+		impulseResponse = impulseResponse / energy
+	return impulseResponse
+
+# Implements a convolution reverb effect
+# The sound is convolved with an impulse response by FFT overlap-add, one block of blockSize samples at a time
+# impulseResponse - Impulse response array (generated from reverbTime when None, see generateImpulseResponse / loadImpulseResponse)
+# reverbTime      - Length in msecs of the generated impulse response
+# mix             - Weight given to original signal vs reverberated signal
+# blockSize       - Number of samples convolved at once
+# extendTail      - Make the output longer than the original sound so the reverb tail is not cut off
+class Reverb():
+	def __init__(self, impulseResponse = None, reverbTime = 1500.0, mix = 0.3, blockSize = 8192, extendTail = False, clipMode = CLIP_HARD):
+		if impulseResponse is None:
+			impulseResponse = generateImpulseResponse(reverbTime)
+		self.impulseResponse = np.asarray(impulseResponse, dtype = np.float64)
+		self.impulseDigest   = hashlib.sha1(self.impulseResponse.tobytes()).hexdigest()
+		self.mix        = mix
+		self.blockSize  = int(blockSize)
+		self.extendTail = extendTail
+		self.clipMode   = clipMode
+		self.reset()
+
+	# Forget the tail of previously processed blocks
+	def reset(self):
+		self.overlap = np.zeros(len(self.impulseResponse) - 1)
+
+	# Number of samples the reverb lasts after the end of the original sound
+	def getTailLength(self):
+		return len(self.impulseResponse) - 1
+
+	# FFT of the impulse response zero padded to fftSize, cached between blocks and renders
+	def getImpulseSpectrum(self, fftSize):
+		key = (self.impulseDigest, fftSize)
+		spectrum = impulseSpectrumCache.get(key)
+		if spectrum is None:
+			spectrum = np.fft.rfft(self.impulseResponse, fftSize)
+			impulseSpectrumCache.put(key, spectrum)
+		return spectrum
+
+	# Weights of original sound and reverberated sound based on mix value
+	def getGains(self):
+		return (max(limitAmplitude(1 - self.mix), 0.0), max(limitAmplitude(self.mix), 0.0))
+
+	# Apply the reverb to the next block of a sound and return the processed block
+	def processBlock(self, block):
+		dryGain, wetGain = self.getGains()
+		newBlock = self.convolveBlock(block)
+		newBlock *= wetGain
+		newBlock += dryGain * block
+		return clipSound(newBlock, self.clipMode, out = newBlock)
+
+	# Convolve the next block of the sound with the impulse response and return the reverberated block
+	# The part of the convolution running past the block is kept and added to the following blocks
+	def convolveBlock(self, block):
+		blockLength = len(block)
+		fullLength  = blockLength + len(self.overlap)
+		fftSize     = 1 << max(fullLength - 1, 1).bit_length()
+
+		convolved = np.fft.irfft(np.fft.rfft(block, fftSize) * self.getImpulseSpectrum(fftSize), fftSize)[:fullLength]
+		convolved[:len(self.overlap)] += self.overlap
+		self.overlap = convolved[blockLength:]
+		return convolved[:blockLength]
+
+	def generateReverbSound(self, soundObj):
+		sound  = soundObj.getSound()
+		length = len(sound) + (self.getTailLength() if self.extendTail else 0)
+
+		# Reverberate the sound block by block
+		self.reset()
+		newSound = np.zeros(length)
+		for start in range(0, len(sound), self.blockSize):
+			stop = min(start + self.blockSize, len(sound))
+			newSound[start:stop] = self.convolveBlock(sound[start:stop])
+		newSound[len(sound):] = self.overlap[:length - len(sound)]
+		self.reset()
+
+		# Weights of original sound and reverberated sound based on mix value
+		dryGain, wetGain = self.getGains()
+		newSound *= wetGain
+		newSound[:len(sound)] += dryGain * sound
+		clipSound(newSound, self.clipMode, out = newSound)
+
+		reverbSoundObj = SoundGenerator(waveType = "Combination", frequency = soundObj.getFrequency(), amplitude = np.max(newSound) if length > 0 else 0.0, duration = float(length) / SAMPLE_RATE, clipMode = self.clipMode)
+		reverbSoundObj.setSound(newSound)
+		return reverbSoundObj
+
+# Number of samples an EffectChain runs through its effects at once
+EFFECT_BLOCK_SIZE = 8192
+
+# Runs effects (with processBlock) one after the other over successive versions of a sound, such as the renders of a score being edited
+# An output sample only depends on the input samples up to the total tail length of the effects before it
+# so when only some ranges of the sound changed since the last call (see ScoreManager.getChangedRanges)
+# only those ranges and the tails after them are processed again, the rest of the last output is reused
+class EffectChain():
+	def __init__(self, effects, blockSize = EFFECT_BLOCK_SIZE):
+		self.effects   = effects
+		self.blockSize = int(blockSize)
+		self.output    = None # Output of the last call
+
+	# Number of samples an input sample reaches after itself through all the effects
+	def getTailLength(self):
+		return sum([effect.getTailLength() for effect in self.effects])
+
+	# Output length for a sound of sampleCount samples, longer when effects have extendTail
+	def getOutputLength(self, sampleCount):
+		return sampleCount + sum([effect.getTailLength() for effect in self.effects if effect.extendTail])
+
+	# Apply the effects to a sound array and return the processed array
+	# changedRanges are the sample ranges changed since the sound of the last call, None when all of it may have changed
+	def process(self, sound, changedRanges = None):
+		outputLength = self.getOutputLength(len(sound))
+		if self.output is None or changedRanges is None or len(self.output) != outputLength:
+			self.output = self.processRange(sound, 0, outputLength)
+		else:
+			tail = self.getTailLength()
+			for first, last in mergeRanges([(first, min(last + tail, outputLength)) for first, last in changedRanges]):
+				self.output[first:last] = self.processRange(sound, first, last)
+		return self.output.copy()
+
+	# Output of the effects for samples first to last of the output
+	# The effects start from silence a whole tail length earlier (on the block grid of a full run), so they reach first in the same state
+	def processRange(self, sound, first, last):
+		for effect in self.effects:
+			effect.reset()
+		start  = max(first - self.getTailLength(), 0) // self.blockSize * self.blockSize
+		output = np.empty(last - first)
+		for blockStart in range(start, last, self.blockSize):
+			blockEnd = min(blockStart + self.blockSize, last)
+			block = np.zeros(blockEnd - blockStart)
+			inputEnd = min(blockEnd, len(sound))
+			if blockStart < inputEnd:
+				block[:inputEnd - blockStart] = sound[blockStart:inputEnd]
+			for effect in self.effects:
+				block = effect.processBlock(block)
+			if blockEnd > first:
+				low = max(blockStart, first)
+				output[low - first:blockEnd - first] = block[low - blockStart:]
+		return output
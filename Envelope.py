@@ -1,12 +1,14 @@
 import numpy as np
-from scipy.io.wavfile import write
-from math import pi, sin, floor
-from fractions import gcd
 
 from SoundGenerator import SoundGenerator
-from Note import Note
-from UtilityFunctions import *
-from Effects import Delay
+from UtilityFunctions import SAMPLE_RATE, convertTimeToSampleCount
+from NoteCache import NoteCache
+
+# Memory budget of the ADSR curve cache shared by all envelopes
+ENVELOPE_CACHE_BYTES = 16 * 1024 * 1024
+
+# ADSR curves keyed on (A, D, S, R, note sample count)
+envelopeCurveCache = NoteCache(ENVELOPE_CACHE_BYTES)
 
 # Handle generaton of ADSR Envelope Object (Type: SoundGenerator)
 class Envelope():
@@ -17,61 +19,83 @@ class Envelope():
 		self.sustain = float(sustain)
 		self.release = float(release)
 		
+	# Envelope parameters as a tuple: (A, D, S, R)
+	def getParameters(self):
+		return (self.attack, self.decay, self.sustain, self.release)
+
+	# Number of samples in the A, D, S and R parts of the envelope for a note of sampleCount samples
+	# Attack and decay are cut short when the note is shorter than them, release is always added after the note
+	def getSegmentCounts(self, sampleCount):
+		attackCount  = convertTimeToSampleCount(self.attack)
+		decayCount   = convertTimeToSampleCount(self.decay)
+		releaseCount = convertTimeToSampleCount(self.release)
+
+		remaining    = sampleCount
+		attackUsed   = min(attackCount, remaining) if remaining > 0 else 0
+		remaining    = remaining - attackCount
+		decayUsed    = min(decayCount, remaining) if remaining > 0 else 0
+		remaining    = remaining - decayCount
+		sustainUsed  = remaining if remaining > 0 else 0
+		return (attackUsed, decayUsed, sustainUsed, releaseCount)
+
+	# Total number of samples in the envelope of a note of sampleCount samples
+	def getEnvelopeLength(self, sampleCount):
+		return sum(self.getSegmentCounts(sampleCount))
+
+	# Return the ADSR curve for a note of sampleCount samples as a read only array
+	# Curves are shared between all envelopes with the same parameters through a cache
+	def getADSRCurve(self, sampleCount):
+		key = self.getParameters() + (sampleCount,)
+		curve = envelopeCurveCache.get(key)
+		if curve is None:
+			curve = self.createADSRCurve(sampleCount)
+			envelopeCurveCache.put(key, curve)
+		return curve
+
+	# Build the ADSR curve by writing each part straight into one preallocated array
+	def createADSRCurve(self, sampleCount):
+		attackUsed, decayUsed, sustainUsed, releaseCount = self.getSegmentCounts(sampleCount)
+		curve = np.empty(attackUsed + decayUsed + sustainUsed + releaseCount)
+
+		start = 0
+		self.fillLinearSegment(curve[start:start + attackUsed], 0.0, 1.0, convertTimeToSampleCount(self.attack))
+		start += attackUsed
+		self.fillLinearSegment(curve[start:start + decayUsed], 1.0, self.sustain, convertTimeToSampleCount(self.decay))
+		start += decayUsed
+		curve[start:start + sustainUsed] = self.sustain
+		start += sustainUsed
+		self.fillLinearSegment(curve[start:], self.sustain, 0.0, releaseCount)
+		return curve
+
+	# Fill segment with the first samples of a line of sampleCount samples going from start to stop
+	def fillLinearSegment(self, segment, start, stop, sampleCount):
+		if len(segment) == 0:
+			return
+		if sampleCount == 1:
+			segment[...] = start
+			return
+		np.multiply(np.arange(len(segment)), (stop - start) / (sampleCount - 1.0), out = segment)
+		segment += start
+
+	# Shape a note sound with the ADSR envelope and return the shaped sound
+	# As with the ** operator the note is repeated to the length of the envelope
+	def applyADSREnvelope(self, sound):
+		shaped = np.resize(sound, (self.getEnvelopeLength(len(sound)),))
+		return self.applyADSREnvelopeInPlace(shaped, len(sound))
+
+	# Multiply a buffer holding the whole enveloped note in place by the ADSR curve of a note of noteSampleCount samples
+	def applyADSREnvelopeInPlace(self, buffer, noteSampleCount):
+		buffer *= self.getADSRCurve(noteSampleCount)
+		return buffer
+
 	# Obtain the ADSR Enevelope to shape note sound from the envelope object
 	# Note that the ADSR envelope object is just a regular Sound Generator Object
 	# With the A, D, S and R parts joined together as a single wave in the sound array
 	def getADSREnvelope(self, soundObj):
-		sampleCount = len(soundObj.getSound())
-		
-		adsr = np.array([])
-		# Handle Attack
-		if (sampleCount > 0):
-			attackEnvelope  = self.getLinearEnvelope(0.0, 1.0, self.attack)
-			attackCount = len(attackEnvelope)
-			if(attackCount > sampleCount):
-				attackEnvelope = attackEnvelope[:sampleCount]
-			sampleCount = sampleCount - attackCount
-			adsr = np.append(adsr, attackEnvelope)
-
-		# Handle Decay
-		if (sampleCount > 0):
-			decayEnvelope  = self.getLinearEnvelope(1.0, self.sustain, self.decay)
-			decayCount = len(decayEnvelope)
-			if(decayCount > sampleCount):
-				decayEnvelope = decayEnvelope[:sampleCount]
-			sampleCount = sampleCount - decayCount
-			adsr = np.append(adsr, decayEnvelope)
-
-		
-		# Handle Sustain
-		if(sampleCount > 0):
-			sustainEnvelope = self.getLinearEnvelope(self.sustain, self.sustain, sampleCount * 1000.0 /SAMPLE_RATE )
-			adsr = np.append(adsr, sustainEnvelope)
-			sampleCount = sampleCount - len(sustainEnvelope)
-
-		# Handle Release
-		releaseEnvelope = self.getLinearEnvelope(self.sustain, 0.0, self.release)
-		adsr = np.append(adsr, releaseEnvelope)
+		adsr = self.getADSRCurve(len(soundObj.getSound()))
 	
 		# Create ADSR Envelope
 		adsrDuration = len(adsr) * 1.0 / SAMPLE_RATE
-		#print(adsrDuration)
 		adsrEnvelopeObject = SoundGenerator("ADSR", 1.0/adsrDuration, np.max(adsr), adsrDuration)
 		adsrEnvelopeObject.setSound(adsr)
 		return adsrEnvelopeObject
-	
-	# Given the start amplotude, the stop amplitude and the duration of the wave
-	# Generates  a sampled linear wave as a SoundGenerator sound array (numpy array)
-	# Used to create A, D, S and R and part of teh ADSR Envelope
-	def getLinearEnvelope(self, start, stop, duration):
-		timeInSeconds = duration / 1000.0
-		# Number of smaples needed
-		sampleCount =  convertTimeToSampleCount(duration)
-		
-		timeArray = np.linspace(0, timeInSeconds, num = sampleCount)
-		
-		slope = (stop - start) / timeInSeconds
-		#print(slope)
-		linearCalculator = np.vectorize(lambda t: slope*t + start)
-		#print (linearCalculator(timeArray))
-		return linearCalculator(timeArray)
\ No newline at end of file
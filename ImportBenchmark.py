@@ -0,0 +1,73 @@
+import sys
+import os
+import subprocess
+import argparse
+
+# Startup benchmark of the core render engine
+# Imports the core modules in fresh interpreters (as a render process would) and fails if the import takes longer than the budget
+# or if a heavy dependency that is only needed later (scipy, the GUI stack) was loaded on the way
+# Example: python ImportBenchmark.py --runs 10 --budget 0.4
+
+# Modules imported by a render process
+CORE_MODULES = ["ScoreManager", "Effects", "WavWriter"]
+
+# Modules that must not be loaded just by importing the core
+HEAVY_MODULES = ["scipy", "PyQt5", "matplotlib", "concurrent.futures", "multiprocessing.shared_memory"]
+
+# Default budget in secs for importing the core modules, numpy included
+IMPORT_BUDGET = 0.5
+
+# Run in the child interpreter: time the imports and print the time taken followed by the heavy modules that were loaded
+CHILD_SCRIPT = """
+import sys, time
+sys.path.insert(0, %r)
+startTime = time.perf_counter()
+for module in %r:
+	__import__(module)
+print(time.perf_counter() - startTime)
+print(" ".join(m for m in %r if m in sys.modules))
+"""
+
+# Import modules in a fresh interpreter and return (secs taken, heavy modules loaded)
+def timeImport(modules):
+	script = CHILD_SCRIPT % (os.path.dirname(os.path.abspath(__file__)), modules, HEAVY_MODULES)
+	output = subprocess.check_output([sys.executable, "-c", script], universal_newlines = True).split("\n")
+	return float(output[0]), output[1].split()
+
+def parseArguments(argv):
+	parser = argparse.ArgumentParser(description = "Check that the core render engine imports within a time budget")
+	parser.add_argument("-n", "--runs", type = int, default = 5, help = "number of fresh interpreters to time (default: 5)")
+	parser.add_argument("-b", "--budget", type = float, default = IMPORT_BUDGET, help = "budget in secs for the median import time (default: %.2f)" % IMPORT_BUDGET)
+	return parser.parse_args(argv)
+
+def main(argv = None):
+	args = parseArguments(argv)
+
+	# numpy on its own is timed as well, everything above it is the cost of the core modules themselves
+	numpyTimes = sorted(timeImport(["numpy"])[0] for i in range(max(args.runs, 1)))
+	coreTimes  = []
+	heavyLoaded = set()
+	for i in range(max(args.runs, 1)):
+		importTime, loaded = timeImport(CORE_MODULES)
+		coreTimes.append(importTime)
+		heavyLoaded.update(loaded)
+	coreTimes.sort()
+
+	numpyTime = numpyTimes[len(numpyTimes) // 2]
+	coreTime  = coreTimes[len(coreTimes) // 2]
+	print("numpy         median %.3fs  min %.3fs" % (numpyTime, numpyTimes[0]))
+	print("core modules  median %.3fs  min %.3fs  (%.3fs above numpy)" % (coreTime, coreTimes[0], coreTime - numpyTime))
+
+	failed = False
+	if heavyLoaded:
+		print("FAILED  heavy modules loaded at import: %s" % ", ".join(sorted(heavyLoaded)), file = sys.stderr)
+		failed = True
+	if coreTime > args.budget:
+		print("FAILED  import took %.3fs, budget is %.3fs" % (coreTime, args.budget), file = sys.stderr)
+		failed = True
+	if not failed:
+		print("OK      within the %.3fs budget" % args.budget)
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -1,10 +1,7 @@
 import numpy as np
-from scipy.io.wavfile import write
-from math import pi, sin, floor
-from fractions import gcd
 
 from SoundGenerator import SoundGenerator
-from UtilityFunctions import *
+from UtilityFunctions import SAMPLE_RATE, TOTAL_EIGHTH_NOTES, getDurationOf8thNote, getNoteFrequency, getPitchChangedData, limitAmplitude, writeWAVToFile
 
 # Class to handle note properties and genderate sound for each note using tempo and an envelope
 class Note:
@@ -25,42 +22,73 @@ class Note:
 		noteValue = newChar + str(newOctave)
 		return Note(noteValue, self.velocity, self.startLocation, self.noteLength, self.waveType)
 	
+	# Generate only the sound of the note itself, without any silence around it
+	# The span starts at the note start location (see getStartSample) and may run past the note end when the envelope adds a release
+	# ScoreManager accumulates these spans directly into a single mix bus
+	def getNoteSpan(self, tempo, envelope, applyEnvelope):
+	
+		# The duration of the actual note in secs
+		# Note length is a the number of eighths making up the note
+		duration       = self.noteLength * float(getDurationOf8thNote(tempo))
+		
+		# Generate sound of note based on note attributes
+		soundPart      = SoundGenerator(waveType = self.waveType, frequency = self.noteFrequency, amplitude = self.velocity, duration = duration)
+
+		if applyEnvelope:
+
+			# Shape note sound with the ADSR envelope of the envelope object
+			shapedSound    = envelope.applyADSREnvelope(soundPart.getSound())
+			soundPart      = SoundGenerator(waveType = "Combination", frequency = self.noteFrequency, amplitude = self.velocity, duration = float(len(shapedSound)) / SAMPLE_RATE)
+			soundPart.setSound(shapedSound)
+		return soundPart
+	
+	# Number of samples in the span of the note (see getNoteSpan), without rendering it
+	def getSpanSampleCount(self, tempo, envelope, applyEnvelope):
+		duration    = self.noteLength * float(getDurationOf8thNote(tempo))
+		sampleCount = int(duration * SAMPLE_RATE)
+		if applyEnvelope:
+			sampleCount = envelope.getEnvelopeLength(sampleCount)
+		return sampleCount
+	
+	# Key identifying the rendered span of the note in a NoteCache
+	# Everything that changes the span is part of the key, the start location is not
+	# Noise notes are random and are never cached (None)
+	def getCacheKey(self, tempo, envelope, applyEnvelope):
+		if self.waveType == "Noise":
+			return None
+		envelopeKey = envelope.getParameters() if applyEnvelope else None
+		return (self.noteValue, self.waveType, self.velocity, self.noteLength, tempo, envelopeKey, SAMPLE_RATE)
+	
+	# Index of the sample at which the note starts in the final music
+	def getStartSample(self, tempo):
+		# The duration of the initial silence in the sound before the note starts
+		initDuration   = self.startLocation   * float(getDurationOf8thNote(tempo))
+		return int(initDuration * SAMPLE_RATE)
+	
 	# Genrate note sound
-	# Each note sound takes up the entire length of the score
+	# Each note sound takes up the entire length of the score (scoreLength in number of 8th notes)
 	# If a note doesnt start at location 0 it will have silence till its start location and silence after it ends
 	# Each of these notes are suprimposed directly to genrate final music
 	
-	def getNoteSound(self, tempo, envelope, applyEnvelope):
+	def getNoteSound(self, tempo, envelope, applyEnvelope, scoreLength = TOTAL_EIGHTH_NOTES):
 	
 		# The duration of the smallest possible length of a note base don the tempo: in secs
 		lengthOf8      = getDurationOf8thNote(tempo)
 		
-		# The duration of the actual note in secs
-		# Note length is a the number of eighths making up the note
-		duration       = self.noteLength * float(lengthOf8)
-		
 		# The duration of the initial silence in the sound before the note starts
 		initDuration   = self.startLocation   * float(lengthOf8)
 		
 		# The duration of teh silence in the entire sound after the note ends
 		# We need this as we want each note sound to take up the entire possible score length 
 		# This enabkes us to directly superimpose note sounds to get the final music 
-		endDuration    = max((TOTAL_EIGHTH_NOTES - (self.startLocation + self.noteLength)) * float(lengthOf8), 0)
+		endDuration    = max((scoreLength - (self.startLocation + self.noteLength)) * float(lengthOf8), 0)
 		
 		# Generate initial silence
 		initialSilence = SoundGenerator(waveType = "Constant",    frequency = 5, amplitude = 0.0, duration = initDuration)
 		
-		# Generate sound of note based on note attributes
-		soundPart      = SoundGenerator(waveType = self.waveType, frequency = self.noteFrequency, amplitude = self.velocity, duration = duration)
-
-		if applyEnvelope:
-
-			# Obtain the ADSR Enevelope to shape note sound from the envelope object
-			# Note that the ADSR envelope object is just a regular Sound Generator Object
-			adsrEnvelope   = envelope.getADSREnvelope(soundPart)
-			# Apply enevelope to shape note sound using the ** operator
+		# Generate sound of note based on note attributes and envelope
+		soundPart      = self.getNoteSpan(tempo, envelope, applyEnvelope)
 
-			soundPart       = adsrEnvelope ** soundPart
 		# Generate end silence if any
 		endSilence     = SoundGenerator(waveType = "Constant",    frequency = 5, amplitude = 0.0, duration = endDuration)
 		
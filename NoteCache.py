@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+# Default memory budget of a note cache in bytes
+NOTE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Least recently used cache of rendered sound arrays, bounded by the total number of bytes held
+# Cached arrays are made read only as the same array is handed out for every hit
+# Caches are shared between threads (score manager copies of render workers, module level caches) so every access holds a lock
+class NoteCache():
+	def __init__(self, maxBytes = NOTE_CACHE_BYTES):
+		self.lock         = threading.Lock()
+		self.maxBytes     = int(maxBytes)
+		self.entries      = OrderedDict()
+		self.currentBytes = 0
+		self.hits         = 0
+		self.misses       = 0
+		self.evictions    = 0
+
+	# Return the cached sound for key (or None) and mark it as most recently used
+	def get(self, key):
+		with self.lock:
+			sound = self.entries.get(key)
+			if sound is None:
+				self.misses += 1
+				return None
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return sound
+
+	# Add a sound to the cache, evicting least recently used sounds until it fits in the budget
+	def put(self, key, sound):
+		if sound.nbytes > self.maxBytes:
+			return
+		sound.setflags(write = False)
+		with self.lock:
+			if key in self.entries:
+				self.currentBytes -= self.entries.pop(key).nbytes
+			self.entries[key] = sound
+			self.currentBytes += sound.nbytes
+			self.evict()
+
+	# Called with the lock held
+	def evict(self):
+		while self.currentBytes > self.maxBytes:
+			key, sound = self.entries.popitem(last = False)
+			self.currentBytes -= sound.nbytes
+			self.evictions += 1
+
+	def setMaxBytes(self, maxBytes):
+		with self.lock:
+			self.maxBytes = int(maxBytes)
+			self.evict()
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.currentBytes = 0
+
+	def getStats(self):
+		with self.lock:
+			return {"hits" : self.hits, "misses" : self.misses, "evictions" : self.evictions, "entries" : len(self.entries), "bytes" : self.currentBytes, "maxBytes" : self.maxBytes}
+
+	def __len__(self):
+		return len(self.entries)
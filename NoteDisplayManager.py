@@ -1,62 +1,118 @@
+import numpy as np
+
 from UtilityFunctions import *
 
 class NoteDisplayManager():
-	def __init__(self, cellwidth = 30):
+	def __init__(self, cellwidth = 30, rows = 8 * 12, columns = TOTAL_EIGHTH_NOTES):
 		self.cellwidth = cellwidth
 
-		# Create Cell Occupied Set:
-		self.occupiedCells = set()
-		self.noteRects = []
-	
-	def removeNote(self, removeIndices):
-		self.noteRects = [self.noteRects[i] for i in range(len(self.noteRects)) if i not in removeIndices]
-		
-	def addNote(self, xgrid, ygrid, noteLength, velocity):
+		# Cell occupancy grid (pitch x time): number of notes covering every cell, a cell is occupied when it is above 0
+		# Counts rather than flags so removing one of two overlapping notes leaves the cell occupied
+		self.occupancy = np.zeros((rows, columns), dtype = np.uint16)
+		self.noteRects = {} # Note id (see NoteTable) -> rectangle of the note
+		self.noteCells = {} # Note id -> (xgrid, ygrid, noteLength) of the note
+
+	# Remove the notes with the given ids
+	def removeNote(self, removeIds):
+		for noteId in removeIds:
+			self.noteRects.pop(noteId, None)
+			if noteId in self.noteCells:
+				self.removeOccupiedCells(*self.noteCells.pop(noteId))
+
+	def addNote(self, xgrid, ygrid, noteLength, velocity, noteId):
 		self.addOccupiedCells(xgrid, ygrid, noteLength)
-		self.addNoteRect(xgrid, ygrid, noteLength, velocity)
-		
+		self.addNoteRect(xgrid, ygrid, noteLength, velocity, noteId)
+		self.noteCells[noteId] = (xgrid, ygrid, noteLength)
+
+	# Takes the NoteTable of a ScoreManager, notes already shown are skipped
+	# Occupied cells of all the new notes are marked at once on whole columns
 	def addNotesFromScoreManager(self, notes):
-		for note in notes:
-			print(note.noteValue)
-			xgrid, ygrid = self.mapFromScoreToGrid(note.noteValue, note.startLocation)
-			self.addNoteRect(xgrid, ygrid, note.noteLength, note.velocity)
-		
+		new = ~np.isin(notes.getIds(), np.fromiter(self.noteCells, dtype = np.int64, count = len(self.noteCells)))
+		xgrid, ygrid = self.mapPitchesToGrid(notes.getColumn("pitch")[new], notes.getColumn("start")[new])
+		length = notes.getColumn("length")[new]
+		self.addOccupiedSpans(xgrid, ygrid, length)
+		for noteId, x, y, noteLength, velocity in zip(notes.getIds()[new].tolist(), xgrid.tolist(), ygrid.tolist(), length.tolist(), notes.getColumn("velocity")[new].tolist()):
+			self.addNoteRect(x, y, noteLength, velocity, noteId)
+			self.noteCells[noteId] = (x, y, noteLength)
+
 	def mapFromScoreToGrid(self, noteValue, startLocation):
 		xgrid = startLocation
 		ygrid = 12 * (int(noteValue[-1]) - 1) + octave1Notes.index(noteValue[:-1])
 		if (ygrid %12 == 11):
 			ygrid -= 12
 		return (xgrid, ygrid)
-		
-		
-	def addNoteRect(self, xgrid, ygrid, noteLength, velocity):
+
+	# mapFromScoreToGrid on whole columns of pitch indices (octave * 12 + note character, see ScoreFile) and start locations
+	def mapPitchesToGrid(self, pitches, startLocations):
+		pitches = pitches.astype(np.int64)
+		ygrid = pitches - 12
+		ygrid[pitches % 12 == 11] -= 12
+		return (startLocations.astype(np.int64), ygrid)
+
+
+	def addNoteRect(self, xgrid, ygrid, noteLength, velocity, noteId):
 		x = (xgrid + 3) * self.cellwidth + 5
-		y = (ygrid + 3) * self.cellwidth 
+		y = (ygrid + 3) * self.cellwidth
 		w = noteLength  * self.cellwidth - 10
 		h = self.cellwidth - 5
-		self.noteRects.append((x, y, w, h, velocity*w))
-		
-	def isCellOccupied(self, xgrid, ygrid):
-		cell = str(xgrid) + "|" + str(ygrid)
-		return (cell in self.occupiedCells)
-		
+		self.noteRects[noteId] = (x, y, w, h, velocity*w)
+
+	# Grow or shrink the occupancy grid to a number of columns (8th notes), occupancy of the kept columns is unchanged
+	def resize(self, columns):
+		rows, oldColumns = self.occupancy.shape
+		if columns > oldColumns:
+			self.occupancy = np.concatenate([self.occupancy, np.zeros((rows, columns - oldColumns), dtype = self.occupancy.dtype)], axis = 1)
+		elif columns < oldColumns:
+			self.occupancy = self.occupancy[:, :columns].copy()
+
+	# Cells of a note clipped to the grid as (row, first column, last column), None if the note is outside the grid
+	def getSpanCells(self, xgrid, ygrid, noteLength):
+		if ygrid < 0 or ygrid >= self.occupancy.shape[0]:
+			return None
+		first = max(xgrid, 0)
+		last  = min(xgrid + noteLength, self.occupancy.shape[1])
+		return (ygrid, first, last) if first < last else None
+
+	# True if any cell of a note of noteLength starting at xgrid would collide with another note
+	def isSpanOccupied(self, xgrid, ygrid, noteLength):
+		cells = self.getSpanCells(xgrid, ygrid, noteLength)
+		return cells is not None and bool(self.occupancy[cells[0], cells[1]:cells[2]].any())
+
 	def addOccupiedCells(self, xgrid, ygrid, noteLength):
-		for i in range(noteLength):
-				cell = str(xgrid + i) + "|" + str(ygrid)
-				self.occupiedCells.add(cell)
-				
+		if xgrid + noteLength > self.occupancy.shape[1]:
+			self.resize(xgrid + noteLength)
+		cells = self.getSpanCells(xgrid, ygrid, noteLength)
+		if cells is not None:
+			self.occupancy[cells[0], cells[1]:cells[2]] += 1
+
 	def removeOccupiedCells(self, xgrid, ygrid, noteLength):
-		for i in range(noteLength):
-				cell = str(xgrid) + "|" + str(grid + i)
-				self.occupiedCells.remove(cell)
-				
+		cells = self.getSpanCells(xgrid, ygrid, noteLength)
+		if cells is not None:
+			span = self.occupancy[cells[0], cells[1]:cells[2]]
+			span -= (span > 0)
+
+	# Mark the cells of many notes at once (arrays of xgrid, ygrid and noteLength)
+	# Every note adds +1 at its first cell and -1 after its last one, a running sum along time gives the counts
+	def addOccupiedSpans(self, xgrid, ygrid, noteLength):
+		if len(xgrid) == 0:
+			return
+		end = xgrid + noteLength
+		self.resize(max(self.occupancy.shape[1], int(end.max())))
+		rows, columns = self.occupancy.shape
+		inside = (ygrid >= 0) & (ygrid < rows) & (noteLength > 0)
+		changes = np.zeros((rows, columns + 1), dtype = np.int64)
+		np.add.at(changes, (ygrid[inside], np.maximum(xgrid[inside], 0)), 1)
+		np.add.at(changes, (ygrid[inside], end[inside]), -1)
+		self.occupancy += np.cumsum(changes, axis = 1)[:, :columns].astype(self.occupancy.dtype)
+
 	def getNoteFromGridNumber(self, ygrid):
 		noteChar = octave1Notes[ygrid % 12]
 		octave   = int(ygrid/12) + 1
 		if(noteChar == "B"):
 			octave += 1
 		return (str(noteChar) + str(octave))
-		
+
 	def clear(self):
-		self.occupiedCells = set()
-		self.noteRects = []
\ No newline at end of file
+		self.occupancy[...] = 0
+		self.noteRects = {}
+		self.noteCells = {}
\ No newline at end of file
@@ -0,0 +1,146 @@
+import numpy as np
+
+from Note import Note
+from ScoreFile import SCORE_DTYPE, WAVE_TYPES, getPitchIndex, getNoteValue, notesToArray
+
+# Highest pitch index a note can have (B9), note values only have a single digit octave
+MAX_PITCH_INDEX = 10 * 12 - 1
+
+# Compact store of the notes of a score: one row per note in a structured array (SCORE_DTYPE, 27 bytes a note)
+# Behaves like a list of notes (len, indexing, iteration, append) but Note objects are only built when a note is read
+# Whole columns can be queried and edited at once (getOverlapping, getPitch, transpose)
+# Every note gets an id that stays the same while other notes are added and removed
+# Ids are handed out in increasing order and rows never change order, so the ids column is sorted
+class NoteTable():
+	def __init__(self, notes = []):
+		self.rows   = np.empty(16, dtype = SCORE_DTYPE) # Only the first count rows hold notes, the rest is room to grow
+		self.ids    = np.empty(16, dtype = np.int64) # Id of the note of every row
+		self.count  = 0
+		self.nextId = 0
+		self.extend(notes)
+
+	# Structured array of the notes (a view, not a copy)
+	def getArray(self):
+		return self.rows[:self.count]
+
+	# One column of the notes (a view, writing to it changes the notes): pitch, velocity, start, length or wave
+	def getColumn(self, name):
+		return self.rows[name][:self.count]
+
+	# Ids of the notes in row order
+	def getIds(self):
+		return self.ids[:self.count]
+
+	# Rows of the notes with the given ids
+	def getRows(self, noteIds):
+		return np.searchsorted(self.getIds(), noteIds)
+
+	# Make room for at least count notes, the capacity is doubled so appending stays cheap
+	def reserve(self, count):
+		if count > len(self.rows):
+			rows = np.empty(max(count, 2 * len(self.rows)), dtype = SCORE_DTYPE)
+			rows[:self.count] = self.rows[:self.count]
+			ids = np.empty(len(rows), dtype = np.int64)
+			ids[:self.count] = self.ids[:self.count]
+			self.rows = rows
+			self.ids  = ids
+
+	# Append a note and return its id
+	def append(self, note):
+		return int(self.extendArray(notesToArray([note]))[0])
+
+	# Append notes given as a list of notes, a NoteTable or a structured array (SCORE_DTYPE)
+	def extend(self, notes):
+		if isinstance(notes, NoteTable):
+			notes = notes.getArray()
+		return self.extendArray(notes if isinstance(notes, np.ndarray) else notesToArray(list(notes)))
+
+	# Append the rows of a structured array and return the ids of the new notes
+	# Velocities are limited the same way Note does
+	def extendArray(self, array):
+		if len(array) and (array["pitch"].min() < 0 or array["pitch"].max() > MAX_PITCH_INDEX or array["wave"].max() >= len(WAVE_TYPES)):
+			raise ValueError("Note pitch or wave code out of range")
+		self.reserve(self.count + len(array))
+		rows = self.rows[self.count:self.count + len(array)]
+		rows[...] = array
+		velocity = rows["velocity"]
+		np.clip(velocity, -1.0, 1.0, out = velocity)
+		np.abs(velocity, out = velocity)
+		ids = self.ids[self.count:self.count + len(array)]
+		ids[:] = np.arange(self.nextId, self.nextId + len(array))
+		self.nextId += len(array)
+		self.count  += len(array)
+		return ids
+
+	# Note object of row i
+	def getNote(self, i):
+		pitch, velocity, start, length, wave = self.rows[i].tolist()
+		return Note(getNoteValue(pitch), velocity, start, length, WAVE_TYPES[wave])
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self.getNote(j) for j in range(*i.indices(self.count))]
+		if i < 0:
+			i += self.count
+		if i < 0 or i >= self.count:
+			raise IndexError("Note index out of range")
+		return self.getNote(i)
+
+	def __iter__(self):
+		for pitch, velocity, start, length, wave in self.getArray().tolist():
+			yield Note(getNoteValue(pitch), velocity, start, length, WAVE_TYPES[wave])
+
+	def __len__(self):
+		return self.count
+
+	# Remove the notes at the given rows, the other notes keep their order (and their ids)
+	# The rows between removed rows are moved down as whole slices, nothing is rebuilt
+	def delete(self, indices):
+		indices = np.unique(indices).tolist()
+		if not indices:
+			return
+		# Rows are moved as plain bytes, copying a structured array field by field is much slower
+		rowBytes = self.rows.view(np.dtype((np.void, SCORE_DTYPE.itemsize)))
+		write = indices[0]
+		for first, last in zip([i + 1 for i in indices], indices[1:] + [self.count]):
+			rowBytes[write:write + last - first] = rowBytes[first:last]
+			self.ids[write:write + last - first]  = self.ids[first:last]
+			write += last - first
+		self.count = write
+
+	def clear(self):
+		self.count = 0
+
+	# Independent copy of the notes, with the same ids
+	def copy(self):
+		table = NoteTable()
+		table.rows   = self.rows[:self.count].copy()
+		table.ids    = self.ids[:self.count].copy()
+		table.count  = self.count
+		table.nextId = self.nextId
+		return table
+
+	# Indices of the notes sounding somewhere in [first, last) (in number of 8th notes)
+	def getOverlapping(self, first, last):
+		start = self.getColumn("start")
+		return np.flatnonzero((start < last) & (start + self.getColumn("length") > first))
+
+	# Indices of the notes of a note value such as A3
+	def getPitch(self, noteValue):
+		return np.flatnonzero(self.getColumn("pitch") == getPitchIndex(noteValue))
+
+	# Indices of the notes of a note value sounding at the grid location x
+	def getCovering(self, x, noteValue):
+		start = self.getColumn("start")
+		return np.flatnonzero((self.getColumn("pitch") == getPitchIndex(noteValue)) & (start <= x) & (x < start + self.getColumn("length")))
+
+	# Change the pitch of notes by a number of half steps: +ve = Pitch Up, -ve = Pitch Down
+	# All notes are changed unless indices are given
+	def transpose(self, halfSteps, indices = None):
+		pitch = self.getColumn("pitch")
+		if indices is None:
+			indices = slice(None)
+		newPitch = pitch[indices].astype(np.int64) + int(halfSteps)
+		if len(newPitch) and (newPitch.min() < 0 or newPitch.max() > MAX_PITCH_INDEX):
+			raise ValueError("Transposed notes out of range")
+		pitch[indices] = newPitch
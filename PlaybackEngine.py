@@ -0,0 +1,348 @@
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+from ScoreManager import ScoreManager, RenderCancelledError
+from WavWriter import WavWriter, SAMPLE_FORMATS
+from UtilityFunctions import SAMPLE_RATE, getDurationOf8thNote
+
+# Number of samples handed to the audio sink at once (about 23 ms at SAMPLE_RATE)
+PLAYBACK_BLOCK_SIZE = 256
+
+# Number of blocks the ring buffer holds: how far rendering may run ahead of the play head
+RING_BUFFER_BLOCKS = 16
+
+# Number of blocks rendered before the sink is started, so the first blocks do not underrun
+PREFILL_BLOCKS = 2
+
+# Ring buffer of samples between exactly one producer thread and one consumer thread
+# Lock free: the producer only moves writeCount and the consumer only moves readCount
+# Both counts only grow, the position of a sample in the array is its count modulo the capacity
+# A count is only moved after the samples are copied so the other side never sees a half written block
+class RingBuffer():
+	def __init__(self, capacity):
+		self.buffer     = np.zeros(int(capacity))
+		self.readCount  = 0
+		self.writeCount = 0
+
+	# Number of samples waiting to be read
+	def getAvailable(self):
+		return self.writeCount - self.readCount
+
+	# Number of samples that can be written
+	def getFree(self):
+		return len(self.buffer) - self.getAvailable()
+
+	# Copy as many samples of block as fit in the buffer and return their number
+	def write(self, block):
+		count    = min(len(block), self.getFree())
+		position = self.writeCount % len(self.buffer)
+		first    = min(count, len(self.buffer) - position)
+		self.buffer[position:position + first] = block[:first]
+		self.buffer[:count - first] = block[first:count]
+		self.writeCount += count
+		return count
+
+	# Fill out with as many samples as are waiting (at most len(out)) and return their number
+	def read(self, out):
+		count    = min(len(out), self.getAvailable())
+		position = self.readCount % len(self.buffer)
+		first    = min(count, len(self.buffer) - position)
+		out[:first] = self.buffer[position:position + first]
+		out[first:count] = self.buffer[:count - first]
+		self.readCount += count
+		return count
+
+# Audio sinks pull the samples to play
+# start(sampleRate, blockSize, callback) makes the sink call callback(out) from a thread of its own
+# with an array of blockSize samples to fill, the callback returns how many of them to play (0 once the music is over)
+# wait(timeout) waits for the sink to be done and getLatency() is the time in secs a sample takes to be heard
+# realTime is False for sinks that do not play as time goes by, they are never short of samples: the callback waits for them
+
+# Sink playing to nowhere, for headless use and testing
+# realTime - Pull one block every block duration like a sound card would, or as fast as possible
+class NullSink():
+	def __init__(self, realTime = True):
+		self.realTime = realTime
+		self.thread   = None
+		self.stopped  = False
+
+	def start(self, sampleRate, blockSize, callback):
+		self.sampleRate = sampleRate
+		self.blockSize  = blockSize
+		self.callback   = callback
+		self.stopped    = False
+		self.thread     = threading.Thread(target = self.run, daemon = True)
+		self.thread.start()
+
+	def run(self):
+		out = np.zeros(self.blockSize)
+		nextTime = time.perf_counter()
+		try:
+			while not self.stopped:
+				count = self.callback(out)
+				if count == 0:
+					break
+				self.consume(out[:count])
+				if self.realTime:
+					nextTime += float(self.blockSize) / self.sampleRate
+					time.sleep(max(nextTime - time.perf_counter(), 0.0))
+		finally:
+			self.close()
+
+	# Called with every block played
+	def consume(self, block):
+		pass
+
+	def close(self):
+		pass
+
+	def stop(self):
+		self.stopped = True
+		self.wait()
+
+	def wait(self, timeout = None):
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout)
+		return self.thread is None or not self.thread.is_alive()
+
+	def getLatency(self):
+		return 0.0
+
+# Sink writing what is played to a wav file (filename without the .wav extension, as writeWAVToFile)
+# By default blocks are pulled as fast as possible, so a score is written as quickly as it can be rendered
+class FileSink(NullSink):
+	def __init__(self, filename, sampleFormat = "float64", realTime = False):
+		super(FileSink, self).__init__(realTime)
+		self.filename     = filename
+		self.sampleFormat = sampleFormat
+		self.writer       = None
+
+	def start(self, sampleRate, blockSize, callback):
+		self.writer = WavWriter(self.filename + ".wav", sampleRate, self.sampleFormat)
+		super(FileSink, self).start(sampleRate, blockSize, callback)
+
+	def consume(self, block):
+		self.writer.writeBlock(block)
+
+	def close(self):
+		self.writer.close()
+
+# Sink playing on an audio device through the sounddevice package (PortAudio)
+# sounddevice is an optional dependency, creating this sink raises ImportError (or OSError without PortAudio) when it is missing
+class SoundDeviceSink():
+	def __init__(self, device = None, latency = "low"):
+		import sounddevice
+		self.sounddevice = sounddevice
+		self.device      = device
+		self.latency     = latency
+		self.realTime    = True
+		self.stream      = None
+		self.done        = threading.Event()
+
+	def start(self, sampleRate, blockSize, callback):
+		out = np.zeros(blockSize)
+		def streamCallback(outdata, frames, timeInfo, status):
+			count = callback(out[:frames])
+			outdata[:, 0] = out[:frames]
+			if count == 0:
+				raise self.sounddevice.CallbackStop()
+		self.done.clear()
+		self.stream = self.sounddevice.OutputStream(samplerate = sampleRate, blocksize = blockSize, channels = 1, dtype = "float32", device = self.device, latency = self.latency, callback = streamCallback, finished_callback = self.done.set)
+		self.stream.start()
+
+	def stop(self):
+		if self.stream is not None:
+			self.stream.abort()
+			self.stream.close()
+			self.stream = None
+		self.done.set()
+
+	def wait(self, timeout = None):
+		return self.done.wait(timeout)
+
+	def getLatency(self):
+		return self.stream.latency if self.stream is not None else 0.0
+
+# Audio device when sounddevice is available, otherwise a real time NullSink
+def getDefaultSink():
+	try:
+		return SoundDeviceSink()
+	except (ImportError, OSError):
+		return NullSink()
+
+# Plays the music of a score manager through an audio sink while it is being rendered
+# A render thread streams blocks (ScoreManager.generateBlocks) into a RingBuffer just ahead of the play head
+# and the sink thread takes them out, so playback starts after PREFILL_BLOCKS blocks whatever the length of the score
+# The score manager is read by the render thread while playing, give the engine a copy (ScoreManager.copy) to keep editing
+# effects - Effects applied block by block (with processBlock), as for ScoreManager.generateBlocks
+class PlaybackEngine():
+	def __init__(self, sm, sink = None, effects = [], blockSize = PLAYBACK_BLOCK_SIZE, bufferBlocks = RING_BUFFER_BLOCKS, prefillBlocks = PREFILL_BLOCKS):
+		self.sm            = sm
+		self.sink          = sink if sink is not None else getDefaultSink()
+		self.effects       = effects
+		self.blockSize     = int(blockSize)
+		self.bufferBlocks  = int(bufferBlocks)
+		self.prefillBlocks = min(int(prefillBlocks), self.bufferBlocks)
+		self.renderThread  = None
+		self.sinkStarted   = False
+		self.stopped       = True
+		self.renderDone    = True
+		self.ring          = RingBuffer(self.blockSize * self.bufferBlocks)
+		self.startSample   = 0
+		self.resetStats()
+
+	def resetStats(self):
+		self.underruns      = 0 # Blocks the sink asked for before they were rendered
+		self.samplesPlayed  = 0
+		self.blocksRendered = 0
+		self.renderTime     = 0.0 # Total and worst time spent rendering a block
+		self.maxRenderTime  = 0.0
+		self.playTime       = None # When play was called and when the first samples went to the sink
+		self.firstSoundTime = None
+
+	# Start playing from a location of the score (in number of 8th notes), playback already going on is stopped first
+	def play(self, startLocation = 0):
+		self.stop()
+		self.resetStats()
+		self.ring        = RingBuffer(self.blockSize * self.bufferBlocks)
+		self.startSample = int(startLocation * getDurationOf8thNote(self.sm.tempo) * SAMPLE_RATE)
+		self.stopped     = False
+		self.renderDone  = False
+		self.sinkStarted = False
+		self.playTime    = time.perf_counter()
+		self.renderThread = threading.Thread(target = self.render, daemon = True)
+		self.renderThread.start()
+
+	# Render thread: fill the ring buffer block by block, waiting while it is full
+	def render(self):
+		blocks = self.sm.generateBlocks(self.blockSize, self.effects, isCancelled = self.isStopped, startSample = self.startSample)
+		blockTime = float(self.blockSize) / SAMPLE_RATE
+		try:
+			while True:
+				renderStart = time.perf_counter()
+				block = next(blocks, None)
+				if block is None:
+					break
+				renderTime = time.perf_counter() - renderStart
+				self.renderTime    += renderTime
+				self.maxRenderTime  = max(self.maxRenderTime, renderTime)
+				self.blocksRendered += 1
+
+				written = self.ring.write(block)
+				while written < len(block):
+					self.startSink()
+					if self.stopped:
+						return
+					time.sleep(blockTime / 2)
+					written += self.ring.write(block[written:])
+				if self.blocksRendered >= self.prefillBlocks:
+					self.startSink()
+		except RenderCancelledError:
+			return
+		finally:
+			self.renderDone = True
+		# Music shorter than the prefill
+		self.startSink()
+
+	def startSink(self):
+		if not self.sinkStarted and not self.stopped:
+			self.sinkStarted = True
+			self.sink.start(SAMPLE_RATE, self.blockSize, self.fillBlock)
+
+	# Sink callback: fill out from the ring buffer, with silence for whatever has not been rendered yet (an underrun)
+	# Returns the number of samples to play: all of out but for the end of the music, 0 once it has all been played
+	def fillBlock(self, out):
+		if not self.sink.realTime:
+			while self.ring.getAvailable() < len(out) and not self.renderDone and not self.stopped:
+				time.sleep(0.0005)
+		# Read before the ring buffer so no block written in between is missed
+		renderDone = self.renderDone
+		count = self.ring.read(out)
+		out[count:] = 0.0
+		if count and self.firstSoundTime is None:
+			self.firstSoundTime = time.perf_counter()
+		self.samplesPlayed += count
+		if renderDone:
+			return count
+		if count < len(out):
+			self.underruns += 1
+		return len(out)
+
+	def isStopped(self):
+		return self.stopped
+
+	def isPlaying(self):
+		return not self.stopped and not (self.renderDone and self.sink.wait(0))
+
+	# Wait for the music to be played to the end, returns False if it is still playing after timeout secs
+	def wait(self, timeout = None):
+		renderThread = self.renderThread
+		if renderThread is not None:
+			renderThread.join(timeout)
+			if renderThread.is_alive():
+				return False
+		return self.sink.wait(timeout) if self.sinkStarted else True
+
+	def stop(self):
+		self.stopped = True
+		if self.renderThread is not None:
+			self.renderThread.join()
+			self.renderThread = None
+		if self.sinkStarted:
+			self.sink.stop()
+			self.sinkStarted = False
+
+	# Location of the play head in secs from the start of the music
+	def getPosition(self):
+		return float(self.startSample + self.samplesPlayed) / SAMPLE_RATE
+
+	# Playback metrics
+	# startLatency  - Secs from play to the first samples handed to the sink (None until then)
+	# bufferLatency - Secs of music rendered but not played yet
+	# outputLatency - Secs the sink (sound card) takes to play a sample
+	# renderLoad    - Mean time spent rendering a block over the duration of a block, above 1.0 playback cannot keep up
+	def getStats(self):
+		blockTime = float(self.blockSize) / SAMPLE_RATE
+		return {
+			"underruns"      : self.underruns,
+			"blocksRendered" : self.blocksRendered,
+			"startLatency"   : self.firstSoundTime - self.playTime if self.firstSoundTime is not None else None,
+			"bufferLatency"  : float(self.ring.getAvailable()) / SAMPLE_RATE,
+			"outputLatency"  : self.sink.getLatency(),
+			"renderLoad"     : self.renderTime / self.blocksRendered / blockTime if self.blocksRendered else 0.0,
+			"maxRenderTime"  : self.maxRenderTime,
+		}
+
+# Example: python PlaybackEngine.py MusicScore.txt --sink file -o preview
+def parseArguments(argv):
+	parser = argparse.ArgumentParser(description = "Play a score file and report playback metrics")
+	parser.add_argument("score", help = "score file to play")
+	parser.add_argument("-t", "--tempo", type = int, default = 100, help = "tempo in beats per minute (default: 100)")
+	parser.add_argument("-s", "--start", type = int, default = 0, help = "start location in number of 8th notes (default: 0)")
+	parser.add_argument("--sink", default = "device", choices = ["device", "null", "file"], help = "where to play: audio device (null when sounddevice is missing), nowhere in real time, or a wav file (default: device)")
+	parser.add_argument("-o", "--output", default = "playback", help = "wav file of the file sink, without the .wav extension (default: playback)")
+	parser.add_argument("-f", "--format", default = "int16", choices = sorted(SAMPLE_FORMATS.keys()), help = "sample format of the file sink (default: int16)")
+	parser.add_argument("-b", "--block-size", type = int, default = PLAYBACK_BLOCK_SIZE, help = "number of samples played at once (default: %d)" % PLAYBACK_BLOCK_SIZE)
+	return parser.parse_args(argv)
+
+def main(argv = None):
+	args = parseArguments(argv)
+	sm = ScoreManager(args.tempo)
+	sm.readScore(args.score)
+	sinks = {"device" : getDefaultSink, "null" : NullSink, "file" : lambda: FileSink(args.output, args.format)}
+	engine = PlaybackEngine(sm, sinks[args.sink](), blockSize = args.block_size)
+	engine.play(args.start)
+	try:
+		engine.wait()
+	except KeyboardInterrupt:
+		pass
+	engine.stop()
+	for name, value in engine.getStats().items():
+		print("%-15s %s" % (name, value))
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
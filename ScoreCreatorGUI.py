@@ -1,15 +1,16 @@
 import sys
 from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView, QGridLayout, QSlider, QDockWidget, QListWidget, QWidget, QLabel, QFileDialog, QDialog, QDial, QDialogButtonBox
-from PyQt5.QtWidgets import QMainWindow, QTextEdit, QAction, QApplication, QMenu, QActionGroup, QGraphicsTextItem, QPushButton, QInputDialog, QHBoxLayout, QVBoxLayout
+from PyQt5.QtWidgets import QMainWindow, QTextEdit, QAction, QApplication, QMenu, QActionGroup, QGraphicsTextItem, QPushButton, QInputDialog, QHBoxLayout, QVBoxLayout, QGraphicsItem, QProgressBar
 from PyQt5.QtGui import QIcon
-from PyQt5.QtGui import QPainter, QColor, QPen, QBrush, QFont
+from PyQt5.QtGui import QPainter, QColor, QPen, QBrush, QFont, QPixmap, QTransform
 from PyQt5.QtCore import QLineF, QEvent, QRectF
 from PyQt5.QtCore import *
 
-from ScoreManager import ScoreManager
+from ScoreManager import ScoreManager, RenderCancelledError
+from PlaybackEngine import PlaybackEngine, NullSink
 from NoteDisplayManager import NoteDisplayManager
 from Note import Note
-from Effects import Delay
+from Effects import Delay, Reverb, EffectChain
 from Envelope import Envelope
 from UtilityFunctions import *
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -17,6 +18,15 @@ from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as Navigatio
 import matplotlib as plt
 from matplotlib.figure import Figure
 
+# Zoom levels of the piano roll, a cell is always a whole number of pixels so background tiles line up exactly
+ZOOM_LEVELS = [0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.6, 2.0]
+
+# Level of detail: below MIN_CELL_PIXELS pixels a cell the grid only has lines every whole note and octave
+# and notes are drawn without their velocity bar, labels are thinned out so they never overlap
+MIN_CELL_PIXELS   = 12
+TIME_LABEL_PIXELS = 30
+NOTE_LABEL_PIXELS = 24
+
 class ScoreCreatorGUI(QMainWindow):
     
 	def __init__(self):
@@ -28,7 +38,7 @@ class ScoreCreatorGUI(QMainWindow):
 		self.octaveNotes = octave1Notes
 		self.cellwidth  = 30
 		self.numoctaves = 8
-		self.xnum       = 128
+		self.xnum       = TOTAL_EIGHTH_NOTES # Grows with the score, see updateGridSize
 		self.ynum   	   = self.numoctaves * 12
 		self.xmax       = self.xnum * (self.cellwidth +1)
 		self.ymax       = self.ynum * (self.cellwidth +1)
@@ -38,25 +48,28 @@ class ScoreCreatorGUI(QMainWindow):
 		self.noteLength = 8
 		self.oscType    = "Sine"
 		self.wavFile    = "Music"
+		self.wavFormat  = "int16" # Sample format of the generated WAV file (see WavWriter)
 		self.applyEnvelope = False
 		self.envParams   = (200.0, 50.0, 0.5, 200.0)
 		self.delayParams = (100.0, 5, 0.5, 0.5)
+		self.reverbParams = (1500.0, 0.3)
 		
 		# Create New Score Manager
 		self.sm = ScoreManager()
 		self.sm.setEnvelope(Envelope(*self.envParams))
 		# Note Display Manager
-		self.ndm = NoteDisplayManager(self.cellwidth)
+		self.ndm = NoteDisplayManager(self.cellwidth, self.ynum, self.xnum)
 
 		# Add GUI Elements
 		self.addMenuOptions()
 		self.addFileMenu()
 		self.addEditMenu()
+		self.addViewMenu()
 		self.addToolsMenu()
 		self.addEnvelopeMenu()
 		self.addEffectsMenu()
 		self.addSliderDock()
-		self.statusBar()
+		self.addStatusBar()
 		self.addSceneAndView()
 
 		# Set Geometry
@@ -80,12 +93,12 @@ class ScoreCreatorGUI(QMainWindow):
 		self.view = QGraphicsView(self.scene, self)		
 		self.setCentralWidget(self.view)
 		#self.view.setContentsMargins(200, 200, 200, 200)
-		self.view.horizontalScrollBar().valueChanged.connect(self.paintGridAndText)
-		self.view.verticalScrollBar().valueChanged.connect(self.paintGridAndText)
+		self.view.horizontalScrollBar().valueChanged.connect(self.updateVisibleItems)
+		self.view.verticalScrollBar().valueChanged.connect(self.updateVisibleItems)
 
 		self.view.installEventFilter(self)
 		self.view.setMouseTracking(True)
-		self.paintGridAndText()
+		self.createSceneItems()
 		self.view.mousePressEvent = self.handleMousePress
 		
 		
@@ -102,13 +115,15 @@ class ScoreCreatorGUI(QMainWindow):
 				startLocation = xgrid
 				
 				note = Note(noteValue, velocity, startLocation, self.noteLength, self.oscType)
-				self.sm.addNote(note)
-				self.ndm.addNote(xgrid, ygrid, self.noteLength, velocity)
+				noteId = self.sm.addNote(note)
+				self.ndm.addNote(xgrid, ygrid, self.noteLength, velocity, noteId)
+				self.addNoteItem(noteId)
 			
 			elif(event.button() == 2):
-				remInds = self.sm.removeNote(xgrid, self.ndm.getNoteFromGridNumber(ygrid))
-				self.ndm.removeNote(remInds)
-			self.paintGridAndText()
+				removeIds = self.sm.removeNote(xgrid, self.ndm.getNoteFromGridNumber(ygrid))
+				self.ndm.removeNote(removeIds)
+				self.removeNoteItems(removeIds)
+			self.updateGridSize()
 				
 	def mapSceneCoordinatesToGrid(self, x, y):
 		note = "C1"
@@ -116,80 +131,226 @@ class ScoreCreatorGUI(QMainWindow):
 		xgrid = int(x/self.cellwidth) - 3
 		ygrid = int(y/self.cellwidth) - 3
 		
-		if(xgrid < 0 or xgrid > 127):
+		if(xgrid < 0 or xgrid > self.xnum - 1):
 			return (-1, -1)
 		if(ygrid < 0 or ygrid > 94):
 			return (-1, -1)
 		
 		return(xgrid, ygrid)
 			
-	def paintGrid(self):
-		xcurr      = self.startwidth * self.cellwidth
-		line = QLineF(xcurr, 0, xcurr, self.ymax - self.cellwidth)
-		self.scene.addLine(line, QPen(QBrush(QColor(200, 0, 0, 150)), 3))
-		for x in range(self.startwidth + 1, self.xnum+self.startwidth + 1):
-			xcurr += self.cellwidth
-			line = QLineF(xcurr, 0, xcurr, self.ymax - self.cellwidth)
-			self.scene.addLine(line, QPen(QBrush(QColor(0, 20, 240, 150)), 1))
-
-		ycurr      = self.startwidth * (self.cellwidth - 1)
-		line = QLineF(0, ycurr, self.xmax - self.cellwidth, ycurr)
-		self.scene.addLine(line, QPen(QBrush(QColor(0, 20, 240, 150)), 2))
-		for y in range(self.startwidth, self.ynum+self.startwidth - 1):
-			ycurr += self.cellwidth
-			line = QLineF(0, ycurr, self.xmax - self.cellwidth, ycurr)
-			self.scene.addLine(line, QPen(QBrush(QColor(0, 20, 240, 150)), 1))
-	
-	def paintNotes(self):
-		for rects in self.ndm.noteRects:
-			rect = QRectF(*rects[0:4])
-			vrect = QRectF(*rects[0:2], rects[4], rects[3])
-			self.scene.addRect(rect , QPen(QBrush(QColor(0, 200, 0, 200)), 1), QBrush(QColor(0,100, 0, 200)))
-			self.scene.addRect(vrect, QPen(QBrush(QColor(0, 200, 0, 200)), 1), QBrush(QColor(0, 255, 0, 200)))
-	
-	def addTimeLabels(self):
-		xcurr      = self.startwidth * self.cellwidth
-		textFont = QFont()
-		textFont.setBold(True)
-
-		for x in range(1, self.xnum + 1):
-			xcurr += self.cellwidth
-			yoffset = self.view.mapToScene(0, 0).y()
-			xoffset = 0
-			if x <= 9:  
-				offset = self.cellwidth / 3
-			elif x <= 99:  
-				offset = self.cellwidth / 4 - self.startwidth
-			text = QGraphicsTextItem(str(x - 1 ))
-			text.setFont(textFont)
-			text.setPos(xcurr + int(xoffset) - self.cellwidth,  yoffset)
-			self.scene.addItem(text)
-			
-	def addNoteLabels(self):
-		ycurr = self.startwidth * self.cellwidth
-		textFont = QFont()
-		textFont.setBold(True)
-		
-		for y in range( 1, self.ynum):
-			ycurr += self.cellwidth
-			xoffset = self.view.mapToScene(0, 0).x()
-			yoffset = 0
-			#print()
-			noteName = self.octaveNotes[y%12-1] + str(int(y/12) + 1)
-			text = QGraphicsTextItem(noteName)
-			text.setFont(textFont)
-			text.setPos(xoffset, ycurr + int(yoffset) - self.cellwidth, )
+	# The scene is built once and then kept up to date item by item
+	# The grid is not made of items, it is the view background painted from tiles cached per zoom level (see drawGridBackground)
+	# Labels and note items only exist for the visible part of the grid and are updated as the view scrolls
+	def createSceneItems(self):
+		self.notePen      = QPen(QBrush(QColor(0, 200, 0, 200)), 1)
+		self.noteBrush    = QBrush(QColor(0,100, 0, 200))
+		self.velocityBrush = QBrush(QColor(0, 255, 0, 200))
+		self.labelFont = QFont()
+		self.labelFont.setBold(True)
+
+		self.zoom       = 1.0
+		self.gridTiles  = {} # (cell size in pixels, vertical lines, horizontal lines) -> tile pixmap
+		self.timeLabels = [] # Pool of time label items
+		self.noteLabels = [] # Pool of note label items
+		self.noteItems  = {} # Note id -> (note rect item, velocity rect item if shown)
+
+		# Start line and top line of the grid, their width is in pixels whatever the zoom level
+		startPen = QPen(QBrush(QColor(200, 0, 0, 150)), 3)
+		startPen.setCosmetic(True)
+		topPen = QPen(QBrush(QColor(0, 20, 240, 150)), 2)
+		topPen.setCosmetic(True)
+		xcurr = self.startwidth * self.cellwidth
+		self.scene.addLine(QLineF(xcurr, 0, xcurr, self.ymax - self.cellwidth), startPen)
+		self.topLine = self.scene.addLine(QLineF(), topPen)
+
+		self.view.drawBackground = self.drawGridBackground
+		self.view.setCacheMode(QGraphicsView.CacheBackground)
+		self.gridColumns = 0
+		self.updateGridSize()
+		self.updateParamGraphs()
+		self.view.resizeEvent = self.handleViewResize
+
+	# Scene coordinates of the top left corner of the first cell
+	def getGridOrigin(self):
+		return QPointF(self.startwidth * self.cellwidth, self.startwidth * (self.cellwidth - 1))
+
+	# Visible part of the scene, the scene is centered in the view when it is smaller than the view
+	def getVisibleSceneRect(self):
+		return self.view.mapToScene(self.view.viewport().rect()).boundingRect().intersected(self.scene.sceneRect())
+
+	# Follow a change of the number of columns: the top line is stretched and the cached background is painted again
+	def resizeGridItems(self):
+		if self.gridColumns == self.xnum:
+			return
+		origin = self.getGridOrigin()
+		self.topLine.setLine(0, origin.y(), self.xmax - self.cellwidth, origin.y())
+		self.gridColumns = self.xnum
+		self.view.resetCachedContent()
+		self.view.viewport().update()
+		self.updateVisibleItems()
+
+	# Paint the grid lines in the exposed part of the view from cached tiles
+	# Tiles are drawn in device pixels so the lines stay one pixel sharp at every zoom level
+	# Cells get vertical and horizontal lines, the strip above them (time labels) only vertical lines
+	# and the strip left of them (note labels) and the first column only horizontal lines
+	def drawGridBackground(self, painter, rect):
+		painter.fillRect(rect, QBrush(QColor(255, 255, 255)))
+		origin = self.getGridOrigin()
+		# The first vertical line is one cell after the start line
+		left   = origin.x() + self.cellwidth
+		width  = (self.xnum - 1) * self.cellwidth
+		height = (self.ynum - 1) * self.cellwidth
+		regions = [(QRectF(0, origin.y(), left, height)     , False, True ),
+		           (QRectF(left, origin.y(), width, height), True , True ),
+		           (QRectF(left, 0, width, origin.y())      , True , False)]
+
+		transform = painter.worldTransform()
+		deviceOrigin = transform.map(origin)
+		painter.save()
+		painter.resetTransform()
+		for region, vertical, horizontal in regions:
+			area = region.intersected(rect)
+			if area.isEmpty():
+				continue
+			# One pixel more so the closing line at the right and bottom of the region is drawn
+			area = transform.mapRect(area).adjusted(0, 0, 1, 1)
+			tile = self.getGridTile(vertical, horizontal)
+			painter.drawTiledPixmap(area, tile, QPointF((area.x() - deviceOrigin.x()) % tile.width(), (area.y() - deviceOrigin.y()) % tile.height()))
+		painter.restore()
+
+	# Background tile for the current zoom level, with a line at its left and or top edge
+	# One cell, or one whole note by one octave when the cells are too small to draw every line
+	def getGridTile(self, vertical, horizontal):
+		cellSize = int(round(self.cellwidth * self.zoom))
+		key = (cellSize, vertical, horizontal)
+		tile = self.gridTiles.get(key)
+		if tile is None:
+			columns, rows = (1, 1) if cellSize >= MIN_CELL_PIXELS else (WHOLE_NOTE, 12)
+			tile = QPixmap(columns * cellSize, rows * cellSize)
+			tile.fill(QColor(255, 255, 255))
+			painter = QPainter(tile)
+			painter.setPen(QPen(QBrush(QColor(0, 20, 240, 150)), max(int(round(self.zoom)), 1)))
+			if vertical:
+				painter.drawLine(0, 0, 0, tile.height())
+			if horizontal:
+				painter.drawLine(0, 0, tile.width(), 0)
+			painter.end()
+			self.gridTiles[key] = tile
+		return tile
+
+	def handleViewResize(self, event):
+		QGraphicsView.resizeEvent(self.view, event)
+		self.updateVisibleItems()
+
+	def updateVisibleItems(self):
+		self.positionLabels()
+		self.syncNoteItems()
+
+	# Show the labels of the visible columns and rows only, label items come from two pools and are reused as the view scrolls
+	# Labels keep their size at every zoom level, when cells get small only every few columns and every C row are labelled
+	def positionLabels(self):
+		visible  = self.getVisibleSceneRect()
+		origin   = self.getGridOrigin()
+		cellSize = self.cellwidth * self.zoom
+
+		step = 1
+		while step * cellSize < TIME_LABEL_PIXELS:
+			step *= 2
+		first = max(int((visible.left() - origin.x()) / self.cellwidth) - 1, 0) // step * step
+		last  = min(int((visible.right() - origin.x()) / self.cellwidth) + 1, self.xnum)
+		self.placeLabels(self.timeLabels, [(str(x), QPointF(origin.x() + x * self.cellwidth, visible.top())) for x in range(first, last, step)])
+
+		ystart = self.startwidth * self.cellwidth
+		first  = max(int((visible.top() - ystart) / self.cellwidth), 1)
+		last   = min(int((visible.bottom() - ystart) / self.cellwidth) + 2, self.ynum)
+		rows   = [y for y in range(first, last) if cellSize >= NOTE_LABEL_PIXELS or y % 12 == 1]
+		self.placeLabels(self.noteLabels, [(self.octaveNotes[y%12-1] + str(int(y/12) + 1), QPointF(visible.left(), ystart + (y - 1) * self.cellwidth)) for y in rows])
+
+	# Show (text, position) labels with the items of a pool, creating items when the pool runs out and hiding the ones left over
+	def placeLabels(self, pool, labels):
+		while len(pool) < len(labels):
+			text = QGraphicsTextItem()
+			text.setFont(self.labelFont)
+			text.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+			text.setZValue(1) # Over the grid and under the notes
 			self.scene.addItem(text)
+			pool.append(text)
+		for text, (label, pos) in zip(pool, labels):
+			if text.toPlainText() != label:
+				text.setPlainText(label)
+			text.setPos(pos)
+			text.setVisible(True)
+		for text in pool[len(labels):]:
+			text.setVisible(False)
+
+	# Items of a note, the velocity bar is left out when the cells are too small to show it
+	def addNoteItem(self, noteId):
+		rects = self.ndm.noteRects[noteId]
+		rect = QRectF(*rects[0:4])
+		vrect = QRectF(*rects[0:2], rects[4], rects[3])
+		items = (self.scene.addRect(rect , self.notePen, self.noteBrush),)
+		if self.cellwidth * self.zoom >= MIN_CELL_PIXELS:
+			items += (self.scene.addRect(vrect, self.notePen, self.velocityBrush),)
+		for item in items:
+			item.setZValue(2)
+		self.noteItems[noteId] = items
+
+	def removeNoteItems(self, noteIds):
+		for noteId in noteIds:
+			for item in self.noteItems.pop(noteId, ()):
+				self.scene.removeItem(item)
+
+	# Keep note items for the notes in or close to (half a view around) the visible part of the grid only
+	# The notes are found with a query on the columns of the note table, then only the difference is added or removed
+	def syncNoteItems(self):
+		visible = self.getVisibleSceneRect()
+		area    = visible.adjusted(-visible.width() / 2, -visible.height() / 2, visible.width() / 2, visible.height() / 2)
+		first   = int(area.left() / self.cellwidth) - self.startwidth - 1
+		last    = int(area.right() / self.cellwidth) - self.startwidth + 1
+		top     = int(area.top() / self.cellwidth) - self.startwidth - 1
+		bottom  = int(area.bottom() / self.cellwidth) - self.startwidth + 1
+
+		notes = self.sm.notes
+		rows  = notes.getOverlapping(first, last)
+		xgrid, ygrid = self.ndm.mapPitchesToGrid(notes.getColumn("pitch")[rows], notes.getColumn("start")[rows])
+		shownIds = set(notes.getIds()[rows][(ygrid >= top) & (ygrid <= bottom)].tolist())
 
-	def paintGridAndText(self):
-		self.scene.clear()
-		self.paintGrid()
-		self.addTimeLabels()
-		self.addNoteLabels()
-		self.paintNotes()
+		self.removeNoteItems([noteId for noteId in self.noteItems if noteId not in shownIds or noteId not in self.ndm.noteRects])
+		for noteId in shownIds:
+			if noteId not in self.noteItems and noteId in self.ndm.noteRects:
+				self.addNoteItem(noteId)
 
+	# Zoom the piano roll to one of ZOOM_LEVELS
+	def setZoom(self, zoom):
+		if zoom == self.zoom:
+			return
+		self.zoom = zoom
+		self.view.setTransform(QTransform.fromScale(zoom, zoom))
+		# Notes get or lose their velocity bar with the zoom level
+		self.removeNoteItems(list(self.noteItems))
+		self.view.resetCachedContent()
+		self.updateVisibleItems()
+
+	def handleZoomIn(self):
+		self.setZoom(min([z for z in ZOOM_LEVELS if z > self.zoom] + [ZOOM_LEVELS[-1]]))
+
+	def handleZoomOut(self):
+		self.setZoom(max([z for z in ZOOM_LEVELS if z < self.zoom] + [ZOOM_LEVELS[0]]))
+
+	def handleZoomReset(self):
+		self.setZoom(1.0)
+
+	# Grow (or shrink) the grid with the score so there is always room for new notes after the last one
+	def updateGridSize(self):
+		self.xnum = max(TOTAL_EIGHTH_NOTES, self.sm.getScoreLength() + TOTAL_EIGHTH_NOTES // 2)
+		self.xmax = self.xnum * (self.cellwidth +1)
+		self.scene.setSceneRect(0, 0, self.xmax, self.ymax)
+		self.ndm.resize(self.xnum)
+		self.resizeGridItems()
+
+	# Redraw the envelope and delay graphs, only needed when their parameters change
+	def updateParamGraphs(self):
 		vals = self.getEnvParamsGraph()
-		print(vals)
 		self.envGraph.ax1.clear()
 		self.envGraph.plot(vals = vals)
 	
@@ -245,6 +406,27 @@ class ScoreCreatorGUI(QMainWindow):
 		self.editMenu.addMenu(self.noteLengthMenu)
 		self.editMenu.addMenu(self.oscillatorMenu)
 
+	def addViewMenu(self):
+		zoomInAction = QAction('Zoom In', self)
+		zoomInAction.setShortcut('Ctrl+=')
+		zoomInAction.setStatusTip('Zoom In')
+		zoomInAction.triggered.connect(self.handleZoomIn)
+
+		zoomOutAction = QAction('Zoom Out', self)
+		zoomOutAction.setShortcut('Ctrl+-')
+		zoomOutAction.setStatusTip('Zoom Out')
+		zoomOutAction.triggered.connect(self.handleZoomOut)
+
+		zoomResetAction = QAction('Actual Size', self)
+		zoomResetAction.setShortcut('Ctrl+0')
+		zoomResetAction.setStatusTip('Reset Zoom')
+		zoomResetAction.triggered.connect(self.handleZoomReset)
+
+		self.viewMenu = self.menubar.addMenu('&View')
+		self.viewMenu.addAction(zoomInAction)
+		self.viewMenu.addAction(zoomOutAction)
+		self.viewMenu.addAction(zoomResetAction)
+
 	def addNoteLengthMenu(self):
 	
 		# Whole Note Action
@@ -391,22 +573,55 @@ class ScoreCreatorGUI(QMainWindow):
 		clearAction.setStatusTip('Clear Score')
 		clearAction.triggered.connect(self.handleClearScore)
 
-		genAction = QAction(QIcon('Icons/Gen.png'), 'Generate', self)
-		genAction.setShortcut('Ctrl+G')
-		genAction.setStatusTip('Generate Music')
-		genAction.triggered.connect(self.handleGen)
+		self.genAction = QAction(QIcon('Icons/Gen.png'), 'Generate', self)
+		self.genAction.setShortcut('Ctrl+G')
+		self.genAction.setStatusTip('Generate Music')
+		self.genAction.triggered.connect(self.handleGen)
+
+		self.cancelGenAction = QAction(QIcon(), 'Cancel Generation', self)
+		self.cancelGenAction.setShortcut('Esc')
+		self.cancelGenAction.setStatusTip('Stop Generating Music')
+		self.cancelGenAction.triggered.connect(self.handleCancelGen)
+		self.cancelGenAction.setEnabled(False)
+		
+		playAction = QAction(QIcon(), 'Play', self)
+		playAction.setShortcut('Ctrl+P')
+		playAction.setStatusTip('Play Music')
+		playAction.triggered.connect(self.handlePlay)
+
+		stopAction = QAction(QIcon(), 'Stop', self)
+		stopAction.setShortcut('Ctrl+.')
+		stopAction.setStatusTip('Stop Playing Music')
+		stopAction.triggered.connect(self.handleStop)
 		
 		self.fileMenu = self.menubar.addMenu('&Tools')
 		self.fileMenu.addAction(clearAction)
-		self.fileMenu.addAction(genAction)
+		self.fileMenu.addAction(self.genAction)
+		self.fileMenu.addAction(self.cancelGenAction)
+		self.fileMenu.addSeparator()
+		self.fileMenu.addAction(playAction)
+		self.fileMenu.addAction(stopAction)
 		
 		self.toolbar = self.addToolBar('Clear Score')
 		self.toolbar.addAction(clearAction)
 		self.toolbar = self.addToolBar('Generate')
-		self.toolbar.addAction(genAction)
+		self.toolbar.addAction(self.genAction)
+
+	# Status bar with a progress bar shown while music is generated
+	def addStatusBar(self):
+		self.renderWorker = None
+		self.player = None
+		self.effectChain = None
+		self.effectSettings = None
+		self.renderProgress = QProgressBar()
+		self.renderProgress.setRange(0, 100)
+		self.renderProgress.setMaximumWidth(200)
+		self.renderProgress.hide()
+		self.statusBar().addPermanentWidget(self.renderProgress)
 		
 	def addEffectsMenu(self):
 		self.addDelayMenu()
+		self.addReverbMenu()
 		
 		# Effects Menu Options
 		self.applyEffectsAction = QAction(QIcon("Icons/effects.png"), 'Apply Effects', self)
@@ -419,6 +634,7 @@ class ScoreCreatorGUI(QMainWindow):
 		self.effectsMenu = QMenu('Effects')
 		self.effectsMenu.addAction(self.applyEffectsAction)
 		self.effectsMenu.addMenu(self.delayMenu)
+		self.effectsMenu.addMenu(self.reverbMenu)
 		
 		self.menubar.addMenu(self.effectsMenu)
 		
@@ -445,6 +661,27 @@ class ScoreCreatorGUI(QMainWindow):
 		self.delayMenu.setIcon(QIcon("Icons/Delay.png"))
 		self.delayMenu.addAction(self.applyDelayAction)
 		self.delayMenu.addAction(delayPrefAction)
+
+	def addReverbMenu(self):
+	
+		# File Menu Options
+		self.applyReverbAction = QAction(QIcon(), 'Apply Reverb', self)
+		self.applyReverbAction.setShortcut('Ctrl+R')
+		self.applyReverbAction.setStatusTip('Apply Reverb to Notes')
+		self.applyReverbAction.toggled.connect(self.handleApplyReverb)
+		self.applyReverbAction.setCheckable(True)
+		self.applyReverbAction.setChecked(False)
+		
+		reverbPrefAction = QAction(QIcon("Icons/Settings.png"), 'Reverb Preferences', self)
+		reverbPrefAction.setShortcut('Alt+R')
+		reverbPrefAction.setStatusTip('Edit Reverb Settings')
+		reverbPrefAction.triggered.connect(self.handleReverb)		
+		
+		
+		self.reverbMenu = QMenu('Reverb')
+		self.reverbMenu.setIcon(QIcon("Icons/effects.png"))
+		self.reverbMenu.addAction(self.applyReverbAction)
+		self.reverbMenu.addAction(reverbPrefAction)
 	
 	def addSliderDock(self):
 		self.sliderTempo = QSlider(1)
@@ -525,9 +762,15 @@ class ScoreCreatorGUI(QMainWindow):
 		fname = QFileDialog.getOpenFileName(self, "Open Score")[0]
 		#self.handleClearScore()
 		if len(fname) >= 1:
-			self.sm.readScore(fname)
+			# Malformed scores are reported with their line numbers, nothing is added from them
+			try:
+				self.sm.readScore(fname)
+			except ValueError as error:
+				self.statusBar().showMessage("Could not open " + fname + ": " + str(error))
+				return
 			self.ndm.addNotesFromScoreManager(self.sm.notes)
-			self.paintGridAndText()
+			self.syncNoteItems()
+			self.updateGridSize()
 		
 	def handleSave(self):
 		fname = QFileDialog.getSaveFileName(self, "Save Score")[0]
@@ -546,42 +789,90 @@ class ScoreCreatorGUI(QMainWindow):
 	def handleClearScore(self):
 		self.sm.clear()
 		self.ndm.clear()
-		self.paintGridAndText()
+		self.syncNoteItems()
+		self.updateGridSize()
 		
+	# Generate the music in a RenderWorker thread so the window stays responsive
+	# The worker renders a copy of the score, notes can be edited while it runs
 	def handleGen(self):
-		self.statusBar().clearMessage()
+		if self.renderWorker is not None:
+			return
 		self.statusBar().showMessage("Initializing Envelope")
+		self.applySoundSettings()
+
+		# The effect chain is kept while the effect settings stay the same, so only changed ranges are processed again
+		applyEffects = self.applyEffectsAction.isChecked()
+		effectSettings = (applyEffects and self.applyDelayAction.isChecked(), tuple(self.delayParams), applyEffects and self.applyReverbAction.isChecked(), tuple(self.reverbParams))
+		if effectSettings != self.effectSettings:
+			effects = []
+			if effectSettings[0]:
+				effects.append(Delay(*self.delayParams))
+			if effectSettings[2]:
+				effects.append(Reverb(reverbTime = self.reverbParams[0], mix = self.reverbParams[1]))
+			self.effectChain    = EffectChain(effects) if effects else None
+			self.effectSettings = effectSettings
+
+		# The worker renders a copy of the score which takes over the previous render, it is handed back when done
+		self.renderWorker = RenderWorker(self.sm.copy(withRender = True), self.effectChain, self.wavFile, self.wavFormat, self)
+		self.renderWorker.progressChanged.connect(self.handleRenderProgress)
+		self.renderWorker.renderDone.connect(self.handleRenderDone)
+		self.genAction.setEnabled(False)
+		self.cancelGenAction.setEnabled(True)
+		self.renderProgress.setValue(0)
+		self.renderProgress.show()
+		self.renderWorker.start()
+
+	# Envelope and tempo of the window to the score manager
+	def applySoundSettings(self):
 		self.sm.setEnvelope(Envelope(*self.envParams))
-		self.statusBar().clearMessage()
-		self.statusBar().showMessage("Initializing Envelope")
-		#print("Writing music score to " + str(self.wavFile) + "Score.txt")
-		self.sm.writeScore(str(self.wavFile) + "Score.txt")
-		self.statusBar().clearMessage()
-		self.statusBar().showMessage("Generating Sound")
-		#print("Generating Sound")
 		self.sm.setTempo(int(self.sliderTempo.value()))
-		soundObj = self.sm.generateSound()
-		if self.applyEffectsAction.isChecked():
-			#print("Applying Effects")
-			self.statusBar().clearMessage()
-			self.statusBar().showMessage("Applying Effects")
 
+	# Play the music from the start while it is rendered (see PlaybackEngine), on a copy of the score
+	# Effects are applied block by block, without a device (sounddevice missing) the music plays to a NullSink
+	def handlePlay(self):
+		self.handleStop()
+		self.applySoundSettings()
+		effects = []
+		if self.applyEffectsAction.isChecked():
 			if self.applyDelayAction.isChecked():
-				#print("Applying Delay")
-				self.statusBar().clearMessage()
-				self.statusBar().showMessage("Applying Delay")
+				effects.append(Delay(*self.delayParams))
+			if self.applyReverbAction.isChecked():
+				effects.append(Reverb(reverbTime = self.reverbParams[0], mix = self.reverbParams[1]))
+		self.player = PlaybackEngine(self.sm.copy(), effects = effects)
+		self.player.play()
+		self.statusBar().showMessage("Playing" + (" (no audio device)" if isinstance(self.player.sink, NullSink) else ""))
 
-				delay = Delay(*self.delayParams)
-				soundObj = delay.generateDelayedSound(soundObj)
+	def handleStop(self):
+		if self.player is not None:
+			self.player.stop()
+			self.player = None
+			self.statusBar().showMessage("Stopped")
 
+	def handleCancelGen(self):
+		if self.renderWorker is not None:
+			self.renderWorker.cancel()
+			self.statusBar().showMessage("Cancelling")
 
-		self.statusBar().clearMessage()
-		self.statusBar().showMessage("Writing WAV file to " + self.wavFile)
-	
-		#print("Writing WAV file to " + self.wavFile)
-		writeWAVToFile(soundObj, self.wavFile)
-		self.statusBar().clearMessage()
-		self.statusBar().showMessage("Music Generation Complete")
+	def handleRenderProgress(self, stage, percent):
+		self.statusBar().showMessage(stage)
+		self.renderProgress.setValue(percent)
+
+	def handleRenderDone(self, message):
+		self.renderWorker.wait()
+		self.sm.adoptRender(self.renderWorker.sm)
+		self.renderWorker = None
+		self.genAction.setEnabled(True)
+		self.cancelGenAction.setEnabled(False)
+		self.renderProgress.hide()
+		self.statusBar().showMessage(message)
+
+	# Playback and a render still running are stopped before the window goes away
+	def closeEvent(self, event):
+		self.handleStop()
+		if self.renderWorker is not None:
+			self.renderWorker.cancel()
+			self.renderWorker.wait()
+		super().closeEvent(event)
 		
 	def handleApplyEnvelope(self):
 		self.sm.setApplyEnvelope(self.applyEnvelopeAction.isChecked())
@@ -596,7 +887,7 @@ class ScoreCreatorGUI(QMainWindow):
 		retparams, ok = dialog.getParameters()
 		if ok:
 			self.envParams = (retparams[0], retparams[1], retparams[2]/20.0, retparams[3])
-			self.paintGridAndText()
+			self.updateParamGraphs()
 
 	def handleApplyEffects(self):
 		pass
@@ -614,7 +905,20 @@ class ScoreCreatorGUI(QMainWindow):
 		retparams, ok = dialog.getParameters()
 		if ok:
 			self.delayParams = (retparams[0], retparams[1], retparams[2]/20.0, retparams[3]/20.0)
-			self.paintGridAndText()
+			self.updateParamGraphs()
+
+	def handleApplyReverb(self):
+		pass
+
+	def handleReverb(self):
+		params = []
+		params.append( Parameter("Reverb Time", "ms", 100, 5000, 50, int(self.reverbParams[0])))
+		params.append( Parameter("Mix"        , ""  ,   0,   20,  1, int(self.reverbParams[1]*20)))
+		dialog = ParamDialog(params = params, name = "Reverb Parameters", icon = QIcon("Icons/effects.png"))
+		retparams, ok = dialog.getParameters()
+		if ok:
+			self.reverbParams = (retparams[0], retparams[1]/20.0)
+			self.updateParamGraphs()
 
 	def handleTempoChange(self):
 		self.tempoLabel.setText("Tempo:" + str(self.sliderTempo.value()))
@@ -622,6 +926,56 @@ class ScoreCreatorGUI(QMainWindow):
 	def handleVelocityChange(self):
 		self.velocityLabel.setText("Note Velocity:" + str(self.sliderVelocity.value() / 100.0))
 		
+# Thread generating the music of a score manager: notes, then effects, then the score and WAV files
+# effectChain  - EffectChain applied to the music or None, it only processes again the sample ranges the render changed (getChangedRanges)
+# Progress is sent as progressChanged(stage, percent), only when the percentage or the stage changes
+# renderDone(message) is sent at the end, whether the render completed, was cancelled or failed
+class RenderWorker(QThread):
+	progressChanged = pyqtSignal(str, int)
+	renderDone      = pyqtSignal(str)
+
+	def __init__(self, sm, effectChain, wavFile, wavFormat, parent = None):
+		super(RenderWorker, self).__init__(parent)
+		self.sm           = sm
+		self.effectChain  = effectChain
+		self.wavFile      = wavFile
+		self.wavFormat    = wavFormat
+		self.cancelled    = False
+		self.lastProgress = None
+
+	# Stop the render at its next step, can be called from any thread
+	def cancel(self):
+		self.cancelled = True
+
+	def isCancelled(self):
+		return self.cancelled
+
+	def reportProgress(self, stage, done, total):
+		progress = (stage, int(100 * done / total) if total else 100)
+		if progress != self.lastProgress:
+			self.lastProgress = progress
+			self.progressChanged.emit(*progress)
+
+	def run(self):
+		try:
+			soundObj = self.sm.generateSound(self.reportProgress, self.isCancelled)
+			if self.effectChain is not None:
+				self.reportProgress("Applying Effects", 0, 1)
+				soundObj = self.sm.createMixSound(self.effectChain.process(soundObj.getSound(), self.sm.getChangedRanges()))
+				self.reportProgress("Applying Effects", 1, 1)
+			if self.cancelled:
+				raise RenderCancelledError("Render cancelled")
+			# The score is written from the copy being rendered, as it was when the render started
+			self.reportProgress("Writing score to " + str(self.wavFile) + "Score.txt", 0, 1)
+			self.sm.writeScore(str(self.wavFile) + "Score.txt")
+			self.reportProgress("Writing WAV file to " + self.wavFile, 0, 1)
+			writeWAVToFile(soundObj, self.wavFile, self.wavFormat)
+			self.renderDone.emit("Music Generation Complete")
+		except RenderCancelledError:
+			self.renderDone.emit("Music Generation Cancelled")
+		except Exception as error:
+			self.renderDone.emit("Music Generation Failed: " + str(error))
+
 class Parameter():
 	def __init__(self, label, units, min, max, step, default):
 		self.label   = label
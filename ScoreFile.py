@@ -0,0 +1,156 @@
+import sys
+import re
+import numpy as np
+
+from Note import Note
+from UtilityFunctions import octave1Notes
+
+# Score files come in two formats
+# Text   - One note per line: N:A3|V:0.2|S:0|L:1|W:Sawtooth, lines starting with # are comments
+# Binary - A .npy file holding a structured array with one row per note (SCORE_DTYPE), loaded memory mapped
+# Both hold exactly the same information and can be converted into each other without loss
+
+# Columns of a binary score
+# pitch    - Pitch index of the note value: octave * 12 + position of the note character in octave1Notes (A3 = 45)
+# velocity - Note loudness
+# start    - Start location in number of 8th notes
+# length   - Note length in number of 8th notes
+# wave     - Position of the wave type in WAVE_TYPES
+SCORE_DTYPE = np.dtype([("pitch", "<i2"), ("velocity", "<f8"), ("start", "<i8"), ("length", "<i8"), ("wave", "u1")])
+
+# Wave types a note can have, the index is the wave code stored in a binary score
+WAVE_TYPES = ["Sine", "Square", "Sawtooth", "Noise", "Constant"]
+WAVE_CODES = dict((waveType, i) for i, waveType in enumerate(WAVE_TYPES))
+
+# Position of every note character in octave1Notes
+NOTE_CHAR_CODES = dict((noteChar, i) for i, noteChar in enumerate(octave1Notes))
+
+# Lines of a text score, one group per column: note character, octave, velocity, start, length, wave type
+# Spaces around the values are allowed, blank lines and comments give no match
+# Any other line is malformed and is captured whole by the last group
+NOTE_LINE_PATTERN = re.compile(r"^[ \t]*(?:N:[ \t]*([A-Za-z]+)(\d)[ \t]*\|[ \t]*V:[ \t]*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)[ \t]*\|[ \t]*S:[ \t]*([+-]?\d+)[ \t]*\|[ \t]*L:[ \t]*([+-]?\d+)[ \t]*\|[ \t]*W:[ \t]*(\w+)[ \t\r]*|([^#\s].*))$", re.MULTILINE)
+
+# Largest start location, length or end of a note (int64 columns)
+MAX_LOCATION = int(np.iinfo(np.int64).max)
+
+# First bytes of every .npy file
+NPY_MAGIC = b"\x93NUMPY"
+
+# Pitch index of a note value such as A3 or Db4
+def getPitchIndex(noteValue):
+	noteChar = noteValue[:-1]
+	if noteChar not in octave1Notes or not noteValue[-1].isdigit():
+		raise ValueError("Unknown note value: " + str(noteValue))
+	return int(noteValue[-1]) * 12 + octave1Notes.index(noteChar)
+
+# Note value of a pitch index
+def getNoteValue(pitchIndex):
+	return octave1Notes[pitchIndex % 12] + str(pitchIndex // 12)
+
+def getWaveCode(waveType):
+	if waveType not in WAVE_TYPES:
+		raise ValueError("Unknown wave type: " + str(waveType))
+	return WAVE_TYPES.index(waveType)
+
+# True if the file is a binary (.npy) score, whatever its extension
+def isBinaryScore(filename):
+	with open(filename, "rb") as infile:
+		return infile.read(len(NPY_MAGIC)) == NPY_MAGIC
+
+# Structured array (SCORE_DTYPE) of a list of notes
+def notesToArray(notes):
+	array = np.empty(len(notes), dtype = SCORE_DTYPE)
+	array["pitch"]    = [getPitchIndex(note.noteValue) for note in notes]
+	array["velocity"] = [note.velocity for note in notes]
+	array["start"]    = [note.startLocation for note in notes]
+	array["length"]   = [note.noteLength for note in notes]
+	array["wave"]     = [getWaveCode(note.waveType) for note in notes]
+	return array
+
+# List of notes of a structured array (SCORE_DTYPE)
+def arrayToNotes(array):
+	noteValues = [getNoteValue(p) for p in range(int(array["pitch"].max()) + 1)] if len(array) else []
+	return [Note(noteValues[pitch], velocity, start, length, WAVE_TYPES[wave]) for pitch, velocity, start, length, wave in zip(array["pitch"].tolist(), array["velocity"].tolist(), array["start"].tolist(), array["length"].tolist(), array["wave"].tolist())]
+
+# Parse a whole text score into a structured array
+# The text is tokenized by one regex pass into columns which are converted and validated as arrays, not line by line
+# Malformed notes raise a ValueError naming their line numbers
+def parseScoreText(text):
+	tokens = NOTE_LINE_PATTERN.findall(text)
+	array = np.empty(len(tokens), dtype = SCORE_DTYPE)
+	if not tokens:
+		return array
+	columns = list(zip(*tokens))
+	if any(columns[6]):
+		raise ValueError("Malformed note on line " + formatLineNumbers([getNoteLineNumbers(text)[i] for i, line in enumerate(columns[6]) if line]))
+
+	# Note characters and wave types are looked up in dictionaries, -1 marks unknown values
+	charCodes = np.array([NOTE_CHAR_CODES.get(c, -1) for c in columns[0]], dtype = np.int16)
+	waveCodes = np.array([WAVE_CODES.get(w, -1) for w in columns[5]], dtype = np.int16)
+
+	array["pitch"]    = np.array(columns[1], dtype = np.int16) * 12 + charCodes
+	array["velocity"] = np.array(columns[2], dtype = np.float64)
+	array["start"]    = parseLocationColumn(text, columns[3], "Start location")
+	array["length"]   = parseLocationColumn(text, columns[4], "Note length")
+	array["wave"]     = np.maximum(waveCodes, 0)
+
+	# The end of a note (start + length) has to fit in a location too
+	endOverflow = (array["length"] > 0) & (array["start"] > MAX_LOCATION - array["length"])
+	for invalid, message in [(charCodes < 0, "Unknown note value"), (waveCodes < 0, "Unknown wave type"), (array["start"] < 0, "Negative start location"), (array["length"] < 1, "Note length below one 8th note"), (endOverflow, "Note end out of range")]:
+		if invalid.any():
+			noteLines = getNoteLineNumbers(text)
+			raise ValueError(message + " on line " + formatLineNumbers([noteLines[i] for i in np.flatnonzero(invalid)]))
+	return array
+
+# Start location or length column of a text score as 64 bit integers
+# Numbers too large for a location raise a ValueError naming their line numbers
+def parseLocationColumn(text, values, name):
+	try:
+		return np.array(values, dtype = np.int64)
+	except OverflowError:
+		noteLines = getNoteLineNumbers(text)
+		raise ValueError(name + " out of range on line " + formatLineNumbers([noteLines[i] for i, value in enumerate(values) if abs(int(value)) > MAX_LOCATION]))
+
+# Line number of every line of a text score that is not blank or a comment, row i of a parsed score comes from line i
+# Only needed to report errors so it is not computed otherwise
+def getNoteLineNumbers(text):
+	return [i + 1 for i, line in enumerate(text.split("\n")) if line.strip() and line.lstrip()[0] != '#']
+
+# Line numbers for an error message, only the first few are listed
+def formatLineNumbers(lineNumbers, limit = 10):
+	text = ", ".join(str(n) for n in lineNumbers[:limit])
+	if len(lineNumbers) > limit:
+		text += " and %d more" % (len(lineNumbers) - limit)
+	return text
+
+# Lines of the text score of a structured array, the same lines Note.__str__ gives
+def formatScoreText(array):
+	noteValues = [getNoteValue(p) for p in range(int(array["pitch"].max()) + 1)] if len(array) else []
+	return ["N:" + noteValues[pitch] + "|V:" + str(velocity) + "|S:" + str(start) + "|L:" + str(length) + "|W:" + WAVE_TYPES[wave] for pitch, velocity, start, length, wave in zip(array["pitch"].tolist(), array["velocity"].tolist(), array["start"].tolist(), array["length"].tolist(), array["wave"].tolist())]
+
+# Read a score file of either format into a structured array
+# Binary scores are memory mapped read only, nothing is read from disk until the columns are used
+def readScoreArray(filename):
+	if isBinaryScore(filename):
+		array = np.load(filename, mmap_mode = "r")
+		if array.dtype != SCORE_DTYPE or array.ndim != 1:
+			raise ValueError("Not a score file: " + str(filename))
+		return array
+	with open(filename, "r") as infile:
+		return parseScoreText(infile.read())
+
+# Write a structured array as a score file, binary if the filename ends with .npy and text otherwise
+def writeScoreArray(filename, array):
+	if filename.endswith(".npy"):
+		np.save(filename, np.asarray(array, dtype = SCORE_DTYPE))
+	else:
+		with open(filename, "w") as outfile:
+			outfile.write("\n".join(formatScoreText(array)))
+
+# Convert a score file from one format to the other (the format of the output is chosen by its extension)
+def convertScore(inFilename, outFilename):
+	writeScoreArray(outFilename, readScoreArray(inFilename))
+
+# Example: python ScoreFile.py MusicScore.txt MusicScore.npy
+if __name__ == "__main__":
+	convertScore(sys.argv[1], sys.argv[2])
@@ -1,37 +1,152 @@
 import numpy as np
-from scipy.io.wavfile import write
-from math import pi, sin, floor
-from fractions import gcd
+import bisect
+import collections
 
 from SoundGenerator import SoundGenerator
 from Note import Note
-from UtilityFunctions import *
+from UtilityFunctions import SAMPLE_RATE, CLIP_HARD, clipSound, getDurationOf8thNote, writeWAVToFile
 from Effects import Delay
 from Envelope import Envelope
+from NoteCache import NoteCache, NOTE_CACHE_BYTES
+from WavWriter import writeWAVBlocksToFile
+from TimelineIndex import TimelineIndex, NoteIntervalIndex, mergeRanges
+from ScoreFile import readScoreArray, writeScoreArray, getPitchIndex
+from NoteTable import NoteTable
+from VoiceBank import VoiceBank, getBatchBounds
+
+# Number of samples rendered at once by the streaming renderer
+DEFAULT_BLOCK_SIZE = 8192
+
+# Number of blocks of the streaming renderer whose notes are looked up and sorted at once
+NOTE_WINDOW_BLOCKS = 64
+
+# Number of time chunks handed to each worker process by the parallel renderer (more chunks balance the load better)
+CHUNKS_PER_WORKER = 4
+
+# Seconds between two cancel checks while waiting for the worker processes of a parallel render
+CANCEL_POLL_INTERVAL = 0.1
+
+# Stages reported to the progress callback of a render
+RENDER_STAGE_NOTES  = "Rendering notes"
+RENDER_STAGE_CLIP   = "Clipping"
+RENDER_STAGE_BLOCKS = "Rendering blocks"
+
+# Raised by a render that was cancelled through its isCancelled callback
+class RenderCancelledError(Exception):
+	pass
+
+# Progress and cancellation of a render
+# progress    - Called as progress(stage, done, total) as the render goes on, stage is one of the RENDER_STAGE names
+# isCancelled - Called at every step, the render stops with a RenderCancelledError as soon as it returns True
+# Both are optional and are called from the thread running the render
+class RenderMonitor():
+	def __init__(self, progress = None, isCancelled = None):
+		self.progress    = progress
+		self.isCancelled = isCancelled
+
+	def update(self, stage, done, total):
+		if self.isCancelled is not None and self.isCancelled():
+			raise RenderCancelledError("Render cancelled while " + stage.lower())
+		if self.progress is not None:
+			self.progress(stage, done, total)
+
+# Pre-clip mix bus of the last render of a score manager and what it was made of, so the next render only redoes what changed
+# settings       - Tempo and envelope the notes were rendered with (see ScoreManager.getRenderSettings)
+# mix            - Sum of the spans of the notes, before clipping
+# rows, ids      - Copy of the notes in the mix (a score array, see ScoreFile) and their ids
+# starts, counts - Span bounds of those notes (see ScoreManager.getNoteSpanArrays)
+class MixState():
+	def __init__(self, settings, mix, rows, ids, starts, counts):
+		self.settings = settings
+		self.mix      = mix
+		self.rows     = rows
+		self.ids      = ids
+		self.starts   = starts
+		self.counts   = counts
+
+# Score manager of a render worker process, kept for all chunks so they share its note cache
+workerScoreManager = None
+
+def initRenderWorker(tempo, envelope, applyEnvelope, cacheBytes):
+	global workerScoreManager
+	workerScoreManager = ScoreManager(tempo, envelope, applyEnvelope, cacheBytes = cacheBytes)
+
+# Render the part [chunkStart, chunkEnd) of a mix bus held in shared memory
+# chunkNotes holds (note, start sample, span length) for every note sounding in the chunk, in the order of the notes list
+# so every sample is the same sum, in the same order, as in a single process render
+def renderChunk(mixName, sampleCount, chunkStart, chunkEnd, chunkNotes):
+	from multiprocessing import shared_memory
+	mixMemory = shared_memory.SharedMemory(name = mixName)
+	try:
+		mix = np.ndarray((sampleCount,), dtype = np.float64, buffer = mixMemory.buf)
+		mix[chunkStart:chunkEnd] = 0.0
+		for note, start, count in chunkNotes:
+			first = max(start, chunkStart)
+			last  = min(start + count, chunkEnd)
+			span  = workerScoreManager.getNoteSpanSound(note)
+			mix[first:last] += span[first - start:last - start]
+		del mix
+	finally:
+		mixMemory.close()
 
 # Class to manage actual creation of music
 class ScoreManager():
 	
 	# Set the tempo, overall envelope control
-	def __init__(self, tempo = 100, envelope = Envelope(1, 1, 1.0, 1), apply = True):
+	# Clip mode is applied once to the master bus (CLIP_DEFER leaves the mix unclipped for later stages)
+	# Rendered note spans are reused from a note cache bounded to cacheBytes
+	def __init__(self, tempo = 100, envelope = Envelope(1, 1, 1.0, 1), apply = True, clipMode = CLIP_HARD, cacheBytes = NOTE_CACHE_BYTES):
 		self.tempo = int(tempo)
 		self.envelope = envelope
 		self.applyEnvelope = apply
-		self.notes = []
+		self.clipMode = clipMode
+		self.noteCache = NoteCache(cacheBytes)
+		self.notes = NoteTable() # Behaves like a list of notes, stored as columns
+		self.timeline = TimelineIndex(self.notes) # End of the score, the score is as long as its notes
+		self.noteIndex = NoteIntervalIndex(self.notes) # Notes of every pitch by location, to find the notes under a grid cell
+		self.renderWorkers = 1 # Number of processes used by generateSound
+		self.mixState = None # Last render, kept so the next one is incremental (see generateSound)
+		self.changedRanges = None # Sample ranges changed by the last render, None when it rendered everything
 		
-	# Add note to the collection of notes, each note is treated individually and is made of silence + noteSound + silence	
+	# Add note to the collection of notes, each note is treated individually and is rendered at its start location
+	# Returns the id of the note (see NoteTable)
 	def addNote(self, note):
-		self.notes.append(note)
+		noteId = self.notes.append(note)
+		self.timeline.add(note.startLocation, note.startLocation + note.noteLength)
+		self.noteIndex.add(getPitchIndex(note.noteValue), note.startLocation, note.startLocation + note.noteLength, noteId)
+		return noteId
+
+	# Add many notes at once (a list of notes or a score array, see ScoreFile), the indexes are sorted once instead of once per note
+	def addNotes(self, notes):
+		first = len(self.notes)
+		noteIds = self.notes.extend(notes)
+		start = self.notes.getColumn("start")[first:]
+		end   = start + self.notes.getColumn("length")[first:]
+		self.timeline.addMany(start, end)
+		self.noteIndex.addMany(self.notes.getColumn("pitch")[first:], start, end, noteIds)
+		return noteIds
 		
+	# Remove the notes of a note value covering a grid location, returns the ids of the removed notes
 	def removeNote(self, clickXGrid, noteValue):
-		removeIndices = []
-		
-		for i in range(len(self.notes)):
-			note = self.notes[i]
-			if(note.noteValue == noteValue and note.startLocation <= clickXGrid and clickXGrid < (note.startLocation + note.noteLength ) ):
-				removeIndices.append(i)
-		self.notes = [self.notes[i] for i in range(len(self.notes)) if i not in removeIndices]
-		return removeIndices
+		pitch = getPitchIndex(noteValue)
+		removeIds = self.noteIndex.getCovering(pitch, clickXGrid)
+		rows = self.notes.getRows(removeIds)
+		start = self.notes.getColumn("start")[rows]
+		for noteId, noteStart, noteEnd in zip(removeIds, start.tolist(), (start + self.notes.getColumn("length")[rows]).tolist()):
+			self.timeline.remove(noteStart, noteEnd)
+			self.noteIndex.remove(pitch, noteStart, noteEnd, noteId)
+		self.notes.delete(rows)
+		return removeIds
+
+	# Change the pitch of every note by a number of half steps: +ve = Pitch Up, -ve = Pitch Down
+	def transpose(self, halfSteps):
+		self.notes.transpose(halfSteps)
+		self.rebuildNoteIndex()
+
+	def rebuildNoteIndex(self):
+		start = self.notes.getColumn("start")
+		self.noteIndex.clear()
+		self.noteIndex.addMany(self.notes.getColumn("pitch"), start, start + self.notes.getColumn("length"), self.notes.getIds())
 		
 	# Parse a given striong to obtain note attributes
 	def parseNoteString(self, noteStr):
@@ -50,26 +165,43 @@ class ScoreManager():
 		return note
 		
 	# Read score file to populate notes list
+	# Text and binary (.npy) score files are both accepted, the format is detected from the file contents (see ScoreFile)
 	def readScore(self, filename):
-		with open(filename, "r") as infile:
-			noteStrings = infile.readlines()
-			noteStrings = [n.strip() for n in noteStrings]
-			for noteString in noteStrings:
-				if noteString[0] == '#':
-					continue
-				self.addNote(self.parseNoteString(noteString))
+		self.addNotes(readScoreArray(filename))
 	
-	# Write notes list as a score file
+	# Write notes list as a score file, binary if the filename ends with .npy and text otherwise
 	def writeScore(self, filename):
-		with open(filename, "w") as outfile:
-			outStr = ""
-			for note in self.notes:
-				outStr += str(note) + '\n'
-			outfile.write(outStr[:-1])
+		writeScoreArray(filename, self.notes.getArray())
 	
 	# Empty list of notes
 	def clear(self):
-		self.notes = []
+		self.notes.clear()
+		self.timeline.clear()
+		self.noteIndex.clear()
+		self.mixState = None
+
+	# Copy of the score manager to render from while the notes of this one keep being edited
+	# The notes and indexes are copied, the note cache is shared so both reuse the same rendered note spans
+	# withRender moves the last render to the copy so its render is incremental, adoptRender takes it back afterwards
+	def copy(self, withRender = False):
+		sm = ScoreManager(self.tempo, self.envelope, self.applyEnvelope, self.clipMode, cacheBytes = 0)
+		sm.noteCache     = self.noteCache
+		sm.renderWorkers = self.renderWorkers
+		sm.notes         = self.notes.copy()
+		sm.timeline      = self.timeline.copy(sm.notes)
+		sm.noteIndex     = self.noteIndex.copy(sm.notes)
+		if withRender:
+			sm.mixState, self.mixState = self.mixState, None
+		return sm
+
+	# Take over the last render of a copy (see copy), notes edited here since the copy was made are found as changed
+	def adoptRender(self, sm):
+		if self.mixState is None:
+			self.mixState = sm.mixState
+
+	# Length of the score in number of 8th notes: the end of the last note
+	def getScoreLength(self):
+		return self.timeline.getEnd()
 	
 	# Set Tempo
 	def setTempo(self, tempo):
@@ -85,15 +217,322 @@ class ScoreManager():
 	def setEnvelope(self, envelope):
 		self.envelope = envelope
 
+	def setClipMode(self, clipMode):
+		self.clipMode = clipMode
+
+	def getClipMode(self):
+		return self.clipMode
+
+	# Render with several processes when workers > 1 (see generateSoundParallel)
+	def setRenderWorkers(self, workers):
+		self.renderWorkers = max(int(workers), 1)
+
+	def setNoteCacheSize(self, cacheBytes):
+		self.noteCache.setMaxBytes(cacheBytes)
+
+	def getNoteCacheStats(self):
+		return self.noteCache.getStats()
+
+	# Return the rendered span of a note, from the note cache when the same note was rendered before
+	def getNoteSpanSound(self, note):
+		key = note.getCacheKey(self.tempo, self.envelope, self.applyEnvelope)
+		if key is not None:
+			span = self.noteCache.get(key)
+			if span is not None:
+				return span
+		span = note.getNoteSpan(self.tempo, self.envelope, self.applyEnvelope).getSound()
+		if key is not None:
+			self.noteCache.put(key, span)
+		return span
+
+	# Start sample and number of samples of the span of every note, in the order of the notes list
+	# Computed on whole columns, the same sums as Note.getStartSample and Note.getSpanSampleCount
+	def getNoteSpanBounds(self):
+		starts, counts = self.getNoteSpanArrays()
+		return list(zip(starts.tolist(), counts.tolist()))
+
+	# getNoteSpanBounds as two arrays: start samples and sample counts
+	def getNoteSpanArrays(self):
+		lengthOf8 = float(getDurationOf8thNote(self.tempo))
+		starts = (self.notes.getColumn("start") * lengthOf8 * SAMPLE_RATE).astype(np.int64)
+		lengths = self.notes.getColumn("length")
+		counts = (lengths * lengthOf8 * SAMPLE_RATE).astype(np.int64)
+		if self.applyEnvelope and len(counts):
+			# Envelope length only depends on the note length, worked out once per distinct length and looked up by length
+			# Distinct lengths are found by counting every length, much quicker than sorting them
+			shortest = int(lengths.min())
+			distinct = np.flatnonzero(np.bincount(lengths - shortest)) + shortest
+			lookup   = np.zeros(int(distinct[-1]) - shortest + 1, dtype = np.int64)
+			lookup[distinct - shortest] = [self.envelope.getEnvelopeLength(c) for c in (distinct * lengthOf8 * SAMPLE_RATE).astype(np.int64).tolist()]
+			counts = lookup[lengths - shortest]
+		return (starts, counts)
+
+	# Number of samples in the music: the score length, or later if an envelope release runs past it
+	# spanArrays are the arrays of getNoteSpanArrays when already worked out
+	def getSoundSampleCount(self, spanArrays = None):
+		starts, counts = spanArrays if spanArrays is not None else self.getNoteSpanArrays()
+		initDuration = self.getScoreLength() * getDurationOf8thNote(self.tempo)
+		sampleCount  = int(initDuration * SAMPLE_RATE)
+		if len(starts):
+			sampleCount = max(sampleCount, int((starts + counts).max()))
+		return sampleCount
+
+	# Tempo and envelope the note spans depend on, a render can only build on a previous one made with the same settings
+	def getRenderSettings(self):
+		return (self.tempo, self.envelope.getParameters(), self.applyEnvelope)
+
 	# Generate sound for each note and superimpose to create music
-	def generateSound(self):
-		# Create empty sound object of max length
-		initDuration   = TOTAL_EIGHTH_NOTES   * getDurationOf8thNote(self.tempo)
-		finalSound = SoundGenerator(waveType = "Constant",    frequency = 5, amplitude = 0.0, duration = initDuration)
-	
-		# Add sound from each note to object
-		for note in self.notes:
-			finalSound = finalSound + note.getNoteSound(self.tempo, self.envelope, self.applyEnvelope)
+	# Every note only synthesizes its own span which is added in place into one preallocated mix bus at its start sample
+	# Notes are rendered in batches, notes of the same shape as one 2D array (see VoiceBank), and added in the order of the notes list
+	# The mix bus is kept before clipping (see MixState) so the next render only redoes the notes changed since
+	# Sample ranges changed by a render are given by getChangedRanges
+	# progress and isCancelled are optional callbacks, see RenderMonitor
+	def generateSound(self, progress = None, isCancelled = None):
+		monitor = RenderMonitor(progress, isCancelled)
+		starts, counts = self.getNoteSpanArrays()
+		sampleCount = self.getSoundSampleCount((starts, counts))
+
+		# The last render is only kept again once this one completes
+		state, self.mixState = self.mixState, None
+		changes = self.getMixChanges(state, starts, counts)
+		if changes is not None:
+			mix, changedRanges = self.updateMix(state, starts, counts, sampleCount, changes, monitor)
+			# Only the samples of the mix are clipped, silence stays silent
+			sound = clipSound(mix, self.clipMode, out = np.empty(sampleCount))
+			finalSound = self.createMixSound(sound)
+		else:
+			# Create empty mix bus of the length of the music
+			spanBounds = list(zip(starts.tolist(), counts.tolist()))
+			if self.renderWorkers > 1 and sampleCount > 0:
+				mix = self.generateMixParallel(spanBounds, sampleCount, monitor)
+			else:
+				mix = np.zeros(sampleCount)
+		
+				# Add sound from each note to the mix bus, notes are rendered in batches by a voice bank
+				voices = VoiceBank(self.tempo, self.envelope, self.applyEnvelope)
+				voices.reserve(self.notes.getArray())
+				self.mixNoteSpans(mix, voices, np.arange(len(starts)), starts, counts, 0, sampleCount, monitor)
+				monitor.update(RENDER_STAGE_NOTES, len(spanBounds), len(spanBounds))
+
+			# Limit sound values once on the final mix based on the clip mode
+			# Only the ranges where notes sound are touched, silent stretches stay untouched zero pages
+			sound = np.zeros(sampleCount)
+			soundingRanges = mergeRanges([(start, start + count) for start, count in spanBounds])
+			for i, (start, end) in enumerate(soundingRanges):
+				monitor.update(RENDER_STAGE_CLIP, i, len(soundingRanges))
+				clipSound(mix[start:end], self.clipMode, out = sound[start:end])
+			monitor.update(RENDER_STAGE_CLIP, len(soundingRanges), len(soundingRanges))
+			finalSound = self.createMixSound(sound, soundingRanges)
+			changedRanges = None
+
+		self.mixState = MixState(self.getRenderSettings(), mix, self.notes.getArray().copy(), self.notes.getIds().copy(), starts, counts)
+		self.changedRanges = changedRanges
+		return finalSound
+
+	# Sample ranges of the music changed by the last render (the ones effects have to process again, see EffectChain)
+	# None when the last render made everything from scratch
+	def getChangedRanges(self):
+		return self.changedRanges
+
+	# Notes changed since the last render (state), matched by id, as rows of the notes list and rows of state:
+	# (notes added since, notes of state removed or changed since, changed notes now)
+	# None when everything has to be rendered again: no last render, other settings, or more than half of the notes changed
+	def getMixChanges(self, state, starts, counts):
+		if state is None or state.settings != self.getRenderSettings():
+			return None
+		ids = self.notes.getIds()
+		kept = np.isin(state.ids, ids, assume_unique = True)
+		keptRows = np.flatnonzero(kept)
+		rows = self.notes.getRows(state.ids[keptRows])
+		changed = state.rows[keptRows] != self.notes.getArray()[rows]
+		staleRows = np.concatenate((np.flatnonzero(~kept), keptRows[changed]))
+		addedRows = np.flatnonzero(~np.isin(ids, state.ids, assume_unique = True))
+		if 2 * (len(staleRows) + len(addedRows)) > max(len(ids), len(state.ids)):
+			return None
+		return (addedRows, staleRows, rows[changed])
+
+	# Bring the mix bus of the last render (state) up to date and return it with the sample ranges that changed
+	# Notes added since come after every other note in the notes list (ids only grow) so their spans are added on top, as a full render would
+	# Samples covered by removed or changed notes (before and after the change) are summed again from the notes sounding there,
+	# in the order of the notes list, rather than subtracting the old spans: the mix stays bit for bit the same as a full render
+	def updateMix(self, state, starts, counts, sampleCount, changes, monitor):
+		addedRows, staleRows, changedRows = changes
+		mix = state.mix
+		if len(mix) != sampleCount:
+			mix = np.concatenate((mix[:sampleCount], np.zeros(max(sampleCount - len(mix), 0))))
+
+		ends = starts + counts
+		staleRanges = list(zip(state.starts[staleRows].tolist(), (state.starts + state.counts)[staleRows].tolist()))
+		staleRanges = mergeRanges(staleRanges + list(zip(starts[changedRows].tolist(), ends[changedRows].tolist())))
+		staleRanges = [(start, min(end, sampleCount)) for start, end in staleRanges if start < sampleCount]
+
+		# The voice bank is told about every note rendered here first, so each voice is rendered once for all the ranges
+		staleNotes = [np.flatnonzero((starts < last) & (ends > first)) for first, last in staleRanges]
+		voices = VoiceBank(self.tempo, self.envelope, self.applyEnvelope)
+		voices.reserve(self.notes.getArray()[np.unique(np.concatenate([addedRows] + staleNotes))])
+
+		# Progress is the number of notes mixed, added notes first and then the notes of every range
+		total = len(addedRows) + sum([len(indices) for indices in staleNotes])
+		self.mixNoteSpans(mix, voices, addedRows, starts, counts, 0, sampleCount, monitor, 0, total)
+		done = len(addedRows)
+		for (first, last), indices in zip(staleRanges, staleNotes):
+			monitor.update(RENDER_STAGE_NOTES, done, total)
+			mix[first:last] = 0.0
+			self.mixNoteSpans(mix, voices, indices, starts, counts, first, last, monitor, done, total)
+			done += len(indices)
+		monitor.update(RENDER_STAGE_NOTES, total, total)
+
+		changedRanges = mergeRanges(staleRanges + list(zip(starts[addedRows].tolist(), ends[addedRows].tolist())))
+		if len(mix) != len(state.mix):
+			# The music got longer or shorter: its end changed too
+			changedRanges = mergeRanges(changedRanges + [(min(len(mix), len(state.mix)), sampleCount)])
+		return (mix, changedRanges)
+
+	# Add the spans of the notes at indices into mix, in that order, only their samples within [first, last)
+	# The spans are rendered by voices (a VoiceBank) in batches of about VOICE_BATCH_SAMPLES samples, see VoiceBank
+	# monitor (optional) gets the number of notes added so far before every batch, counted from done out of total (all the indices by default)
+	def mixNoteSpans(self, mix, voices, indices, starts, counts, first, last, monitor = None, done = 0, total = None):
+		rows = self.notes.getArray()
+		if total is None:
+			total = len(indices)
+		for batchFirst, batchLast in getBatchBounds(counts[indices]):
+			if monitor is not None:
+				monitor.update(RENDER_STAGE_NOTES, done + batchFirst, total)
+			batch = indices[batchFirst:batchLast]
+			for i, span in zip(batch.tolist(), voices.renderSpans(rows[batch])):
+				start = int(starts[i])
+				low   = max(first, start)
+				high  = min(last, start + len(span))
+				if low < high:
+					mix[low:high] += span[low - start:high - start]
+
+	# Render the mix bus with renderWorkers processes
+	# The music is cut in time chunks, each rendered by one worker straight into a mix bus in shared memory
+	# Chunks never overlap and notes are summed in the same order as in a single process render
+	# so the result is bit for bit the same whatever the number of workers
+	# Notes that cannot be cached (noise) would differ between chunks, they are added afterwards by this process
+	# Progress is reported per chunk, chunks not started yet are dropped when the render is cancelled
+	def generateMixParallel(self, spanBounds, sampleCount, monitor = RenderMonitor()):
+		chunkCount = min(self.renderWorkers * CHUNKS_PER_WORKER, sampleCount)
+		chunkSize  = -(-sampleCount // chunkCount)
+		chunkNotes = [[] for c in range(chunkCount)]
+		localNotes = []
+		for note, (start, count) in zip(self.notes, spanBounds):
+			if count == 0:
+				continue
+			if note.getCacheKey(self.tempo, self.envelope, self.applyEnvelope) is None:
+				localNotes.append((note, start, count))
+				continue
+			for c in range(start // chunkSize, (start + count - 1) // chunkSize + 1):
+				chunkNotes[c].append((note, start, count))
+
+		# Only loaded when a parallel render is asked for so single process renders start faster
+		from multiprocessing import shared_memory
+		from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+		mixMemory = shared_memory.SharedMemory(create = True, size = sampleCount * 8)
+		try:
+			initArgs = (self.tempo, self.envelope, self.applyEnvelope, self.noteCache.maxBytes)
+			with ProcessPoolExecutor(self.renderWorkers, initializer = initRenderWorker, initargs = initArgs) as pool:
+				futures = [pool.submit(renderChunk, mixMemory.name, sampleCount, c * chunkSize, min((c + 1) * chunkSize, sampleCount), chunkNotes[c]) for c in range(chunkCount)]
+				try:
+					pending = futures
+					while pending:
+						monitor.update(RENDER_STAGE_NOTES, chunkCount - len(pending), chunkCount)
+						done, pending = wait(pending, timeout = CANCEL_POLL_INTERVAL, return_when = FIRST_COMPLETED)
+						for future in done:
+							future.result()
+					monitor.update(RENDER_STAGE_NOTES, chunkCount, chunkCount)
+				except RenderCancelledError:
+					# Chunks already running are left to finish, they cannot be interrupted
+					pool.shutdown(cancel_futures = True)
+					raise
+			mix = np.array(np.ndarray((sampleCount,), dtype = np.float64, buffer = mixMemory.buf))
+		finally:
+			mixMemory.close()
+			mixMemory.unlink()
+
+		for note, start, count in localNotes:
+			monitor.update(RENDER_STAGE_NOTES, chunkCount, chunkCount)
+			mix[start:start + count] += self.getNoteSpanSound(note)
+		return mix
+
+	# Generate the music as consecutive blocks of blockSize samples instead of one array
+	# Only the notes sounding during a block are mixed into it (in the order of the notes list, as in generateSound)
+	# Each block then goes through the effects in order, effects keep their state from one block to the next
+	# Effects with extendTail get extra blocks after the music for their tail
+	# progress and isCancelled are optional callbacks, see RenderMonitor, progress is reported per block
+	# The blocks can start at any sample (startSample), effects then start from silence at that sample
+	def generateBlocks(self, blockSize = DEFAULT_BLOCK_SIZE, effects = [], progress = None, isCancelled = None, startSample = 0):
+		monitor = RenderMonitor(progress, isCancelled)
+		starts, counts = self.getNoteSpanArrays()
+		ends        = starts + counts
+		sampleCount = self.getSoundSampleCount((starts, counts))
+		sampleCount += sum([effect.getTailLength() for effect in effects if effect.extendTail])
+		for effect in effects:
+			effect.reset()
+
+		# Notes are queued in order of their start sample (notes starting together stay in list order)
+		# They are found and sorted one window of NOTE_WINDOW_BLOCKS blocks at a time, not for the whole score up front
+		# so the first blocks come out quickly whatever the length of the score
+		# The first window also holds the notes started before startSample and still sounding
+		windowEnd   = None
+		queuedNotes = collections.deque() # (start sample, sample count, note index) of the notes of the current window
+		activeNotes = [] # Notes sounding in the current block, in the order of the notes list
+		activeSpans = {} # Rendered span and bounds of every active note
+
+		blockCount = max(-(-(sampleCount - startSample) // blockSize), 0)
+		for blockStart in range(startSample, sampleCount, blockSize):
+			monitor.update(RENDER_STAGE_BLOCKS, (blockStart - startSample) // blockSize, blockCount)
+			blockEnd = min(blockStart + blockSize, sampleCount)
+			block = np.zeros(blockEnd - blockStart)
+
+			if windowEnd is None or blockEnd > windowEnd:
+				window = np.flatnonzero((starts < blockStart + NOTE_WINDOW_BLOCKS * blockSize) & ((ends > startSample) if windowEnd is None else (starts >= windowEnd)))
+				window = window[np.argsort(starts[window], kind = "stable")]
+				queuedNotes.extend(zip(starts[window].tolist(), counts[window].tolist(), window.tolist()))
+				windowEnd = blockStart + NOTE_WINDOW_BLOCKS * blockSize
+
+			# Notes starting in this block become active
+			while queuedNotes and queuedNotes[0][0] < blockEnd:
+				start, count, i = queuedNotes.popleft()
+				bisect.insort(activeNotes, i)
+				activeSpans[i] = (self.getNoteSpanSound(self.notes[i]), start, count)
+
+			# Add the part of every active note falling in this block
+			for i in activeNotes:
+				span, start, count = activeSpans[i]
+				first = max(start, blockStart)
+				last  = min(start + count, blockEnd)
+				if first < last:
+					block[first - blockStart:last - blockStart] += span[first - start:last - start]
+
+			# Blocks without any note are silent and need no clipping
+			if activeNotes:
+				clipSound(block, self.clipMode, out = block)
+
+			# Notes ending in this block are done
+			for i in [i for i in activeNotes if activeSpans[i][1] + activeSpans[i][2] <= blockEnd]:
+				activeNotes.remove(i)
+				del activeSpans[i]
+			for effect in effects:
+				block = effect.processBlock(block)
+			yield block
+		monitor.update(RENDER_STAGE_BLOCKS, blockCount, blockCount)
+
+	# Render the music block by block straight into a wav file, without holding the whole music in memory
+	def writeSoundToFile(self, filename, blockSize = DEFAULT_BLOCK_SIZE, effects = [], sampleFormat = "float64", progress = None, isCancelled = None):
+		writeWAVBlocksToFile(self.generateBlocks(blockSize, effects, progress, isCancelled), filename, sampleFormat)
+
+	# Wrap a mix bus array into a SoundGenerator object
+	# The amplitude is measured over soundingRanges only when given (everything else is silence)
+	def createMixSound(self, mix, soundingRanges = None):
+		if soundingRanges is None:
+			soundingRanges = [(0, len(mix))]
+		# Largest magnitude from the largest and smallest samples, without an array of magnitudes
+		amplitude  = max([max(mix[start:end].max(), -mix[start:end].min()) for start, end in soundingRanges if end > start] + [0.0])
+		finalSound = SoundGenerator(waveType = "Combination", frequency = 5, amplitude = amplitude, duration = float(len(mix)) / SAMPLE_RATE)
+		finalSound.setSound(mix)
 		return finalSound
 		
 if __name__ == "__main__":
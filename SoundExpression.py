@@ -0,0 +1,122 @@
+import numpy as np
+
+from UtilityFunctions import CLIP_DEFER, clipSound
+
+# Nodes of the expression graph built by SoundGenerator operators in lazy mode
+# Building the graph does not touch any samples, the graph is evaluated once when the sound is needed
+# Chains of +, - and scalar * whose inner results are not clipped (CLIP_DEFER) are fused into one output buffer
+# and clipped once at the root of the chain, inner sums that clip stay nodes of their own as in eager mode
+# Every node keeps its result after evaluation so nodes shared by several sounds are only computed once
+
+class SoundExpression():
+	def __init__(self, length):
+		self.length = int(length) # Number of samples produced by the node
+		self.result = None
+
+	# Evaluate node into a new buffer (only once) and return the samples
+	def getResult(self):
+		if self.result is None:
+			out = np.empty(self.length)
+			self.compute(out)
+			self.result = out
+		return self.result
+
+	# Write the samples of the node into out, which must hold exactly self.length samples
+	def evaluateInto(self, out):
+		if self.result is not None:
+			out[...] = self.result
+		else:
+			self.compute(out)
+
+	def compute(self, out):
+		raise NotImplementedError
+
+# Existing sound array, never modified by the evaluator
+class LeafExpression(SoundExpression):
+	def __init__(self, sound):
+		SoundExpression.__init__(self, len(sound))
+		self.result = sound
+
+# Weighted sum of nodes (+, - and scalar *)
+# Shorter terms are only added to the start of the output as in SoundGenerator.combineSounds
+class SumExpression(SoundExpression):
+	def __init__(self, terms, clipMode):
+		# Flatten unevaluated child sums so a whole chain is computed in a single buffer
+		# A child that clips its own result cannot be flattened, the clip would be lost
+		self.terms = []
+		for coeff, node in terms:
+			if isinstance(node, SumExpression) and node.result is None and node.clipMode == CLIP_DEFER:
+				self.terms.extend([(coeff * childCoeff, childNode) for childCoeff, childNode in node.terms])
+			else:
+				self.terms.append((coeff, node))
+		self.clipMode = clipMode
+		SoundExpression.__init__(self, max([node.length for coeff, node in self.terms]))
+
+	def compute(self, out):
+		out[...] = 0.0
+		scratch = None
+		for coeff, node in self.terms:
+			sound = node.getResult()
+			part  = out[:node.length]
+			if coeff == 1.0:
+				part += sound
+			elif coeff == -1.0:
+				part -= sound
+			else:
+				# Scaled terms reuse one scratch buffer instead of allocating a temporary per term
+				if scratch is None:
+					scratch = np.empty(self.length)
+				scaled = np.multiply(sound, coeff, out = scratch[:node.length])
+				part += scaled
+		clipSound(out, self.clipMode, out = out)
+
+# Sample by sample product of two nodes (*)
+# The longer node is evaluated straight into the output and multiplied in place by the shorter one
+class ProductExpression(SoundExpression):
+	def __init__(self, first, second, clipMode):
+		if first.length < second.length:
+			self.longer, self.shorter = second, first
+		else:
+			self.longer, self.shorter = first, second
+		self.clipMode = clipMode
+		SoundExpression.__init__(self, self.longer.length)
+
+	def compute(self, out):
+		self.longer.evaluateInto(out)
+		out[:self.shorter.length] *= self.shorter.getResult()
+		clipSound(out, self.clipMode, out = out)
+
+# Product of the longer node with the shorter node repeated to the same length (**)
+class ModulationExpression(ProductExpression):
+	def compute(self, out):
+		self.longer.evaluateInto(out)
+		shortSound = self.shorter.getResult()
+		cycleLength = len(shortSound)
+		if cycleLength == 0:
+			out[...] = 0.0
+		elif self.length // cycleLength > 64:
+			# Many short repeats are cheaper as one resized array than as a Python loop
+			out *= np.resize(shortSound, (self.length,))
+		else:
+			for start in range(0, self.length, cycleLength):
+				stop = min(start + cycleLength, self.length)
+				out[start:stop] *= shortSound[:stop - start]
+		clipSound(out, self.clipMode, out = out)
+
+# Nodes joined one after the other (^)
+# Each part is evaluated directly into its slice of the output
+class JoinExpression(SoundExpression):
+	def __init__(self, parts):
+		self.parts = []
+		for node in parts:
+			if isinstance(node, JoinExpression) and node.result is None:
+				self.parts.extend(node.parts)
+			else:
+				self.parts.append(node)
+		SoundExpression.__init__(self, sum([node.length for node in self.parts]))
+
+	def compute(self, out):
+		offset = 0
+		for node in self.parts:
+			node.evaluateInto(out[offset:offset + node.length])
+			offset += node.length
@@ -1,12 +1,13 @@
 import numpy as np
-from scipy.io.wavfile import write
-from math import pi, sin, floor
-from fractions import gcd
-from UtilityFunctions import *
+from math import gcd
+from UtilityFunctions import SAMPLE_RATE, CLIP_HARD, CLIP_DEFER, clipSound, limitAmplitude, writeWAVToFile
+from Wavetable import renderOscillator
+from SoundExpression import LeafExpression, SumExpression, ProductExpression, ModulationExpression, JoinExpression
 class SoundGenerator():
 	
 	# Constants
-	def __init__(self, waveType = "Sine", frequency = 500, amplitude = 1.0, duration = 5):
+	# In lazy mode +, -, *, ^ and ** only build an expression graph (see SoundExpression) which is evaluated once by getSound
+	def __init__(self, waveType = "Sine", frequency = 500, amplitude = 1.0, duration = 5, clipMode = CLIP_HARD, lazy = False):
 	
 			# Initialize Internal Variables
 			self.waveType  = str(waveType)
@@ -15,7 +16,9 @@ class SoundGenerator():
 			self.duration  = float(duration)
 			self.sampleCount = self.getSampleCount()
 			self.sound     = np.array([])
-			self.limit     = np.vectorize(limitAmplitude)
+			self.clipMode  = clipMode # Clipping applied to the result of +, - and *
+			self.lazy      = lazy # Build expression graphs instead of computing operator results
+			self.expression = None # Pending expression graph of a lazy result
 
 			# Generate Sound
 			if  (waveType == "Sine"):
@@ -35,47 +38,32 @@ class SoundGenerator():
 		return int(self.duration * SAMPLE_RATE)	
 		pass
 	
-	def getSinglePhaseArray(self):
-		singleCycleLength = SAMPLE_RATE / float(self.frequency)
-		omega = pi * 2 / singleCycleLength
-		phaseArray = np.arange(0, int(singleCycleLength)) * omega
-		return phaseArray
-		
+	# Periodic waves are played from the shared wavetables (see Wavetable) with a phase accumulator
 	def generateSineWave(self):
-		# Get Phase Array		
-		phaseArray = self.getSinglePhaseArray()
-		# Compute Sine Values and scale by amplitude
-		singleCycle = self.amplitude * np.sin(phaseArray)
-		# Resize to match duration
-		return np.resize(singleCycle, (self.sampleCount,)).astype(np.float)	
+		return renderOscillator("Sine", self.frequency, self.amplitude, self.sampleCount)
 		
 	def generateSquareWave(self):
-		# Use the fact that sign of sine is square wave and scale by amplitude
-		return self.amplitude * np.sign(self.generateSineWave())
+		return renderOscillator("Square", self.frequency, self.amplitude, self.sampleCount)
 		
 	def generateSawtoothWave(self):
-		# Get Phase Array		
-		phaseArray = self.getSinglePhaseArray()
-		# Compute Saw Values and scale by amplitude
-		piInverse = 1/pi
-		saw = np.vectorize(lambda x: 1 - piInverse*x) 
-		singleCycle =  self.amplitude * saw(phaseArray)
-		# Resize to match duration
-		return np.resize(singleCycle, (self.sampleCount,)).astype(np.float)	
+		return renderOscillator("Sawtooth", self.frequency, self.amplitude, self.sampleCount)
 
 	def generateConstantWave(self):
-		# Get Phase Array		
-		phaseArray = self.getSinglePhaseArray()
 		# Assign to amplitude
-		singleCycle = self.amplitude
-		# Resize to match duration
-		return np.resize(singleCycle, (self.sampleCount,)).astype(np.float)	
+		return np.full(self.sampleCount, self.amplitude)
 		
 	def generateWhiteNoiseWave(self):
 		# Random samples between -1 and 1
 		return np.random.uniform(-1, 1, self.getSampleCount()) 
 
-	def combineSounds(self, soundObj, operator = '+'):
+	# Combine two sounds sample by sample
+	# clipMode overrides the clip mode of this sound for this combine only
+	def combineSounds(self, soundObj, operator = '+', clipMode = None):
+		if clipMode is None:
+			clipMode = self.clipMode
+		if self.isLazyWith(soundObj):
+			return self.combineSoundsLazy(soundObj, operator, clipMode)
+
 		# Figure out which is the longer sound
 		if len(self.sound) < len(soundObj.getSound()):
 			minSound = np.copy(self.getSound())
@@ -92,16 +80,16 @@ class SoundGenerator():
 		elif operator == '*':	
 			maxSound[0:len(minSound)] = maxSound[0:len(minSound)] * minSound
 
-		# Limite sound values to within -1 and +1
-		newSound = self.limit(maxSound)
+		# Limit sound values to within -1 and +1 (or defer it, based on clip mode)
+		newSound = clipSound(maxSound, clipMode, out = maxSound)
 			
 		# Calculate metadata for new sound
-		newFrequency = int(self.getFrequency()) * int(soundObj.getFrequency()) / gcd(int(self.getFrequency()), int(soundObj.getFrequency()))
+		newFrequency = self.getCombinedFrequency(soundObj)
 		newDuration = float(len(newSound)) / SAMPLE_RATE
 		newAmplitude = np.max(newSound)
 			
 		# Create new sound object and return object
-		returnObj = SoundGenerator(waveType = "Combination", frequency = newFrequency, amplitude = newAmplitude, duration = newDuration)
+		returnObj = SoundGenerator(waveType = "Combination", frequency = newFrequency, amplitude = newAmplitude, duration = newDuration, clipMode = self.clipMode)
 
 		# Set sound value to newSound
 		returnObj.setSound(newSound)
@@ -118,30 +106,44 @@ class SoundGenerator():
 			scaleFactor = limitAmplitude(soundObj)
 			if(scaleFactor < 0):
 				scaleFactor = 0.0
-			returnObj = SoundGenerator(self.waveType, self.frequency, self.amplitude * scaleFactor, self.duration)
+			if self.lazy:
+				returnObj = SoundGenerator(self.waveType, self.frequency, self.amplitude * scaleFactor, self.duration, self.clipMode, lazy = True)
+				returnObj.setExpression(SumExpression([(scaleFactor, self.getExpression())], CLIP_DEFER))
+				return returnObj
+			returnObj = SoundGenerator(self.waveType, self.frequency, self.amplitude * scaleFactor, self.duration, self.clipMode)
 			sound = self.getSound()
 			returnObj.setSound(sound * scaleFactor)
 			return returnObj
 		return self.combineSounds(soundObj, '*')
 	
 	def __xor__(self, soundObj):
+		if self.isLazyWith(soundObj):
+			returnObj = self.createLazySound("Join", self.getCombinedFrequency(soundObj))
+			returnObj.setExpression(JoinExpression([self.getExpression(), soundObj.getExpression()]))
+			return returnObj
 		
 		# Join two sound pieces together
 		newSound = np.append(self.getSound(), soundObj.getSound())
 			
 		# Calculate metadata for new sound
-		newFrequency = int(self.getFrequency()) * int(soundObj.getFrequency()) / gcd(int(self.getFrequency()), int(soundObj.getFrequency()))
+		newFrequency = self.getCombinedFrequency(soundObj)
 		newDuration = self.getDuration() + soundObj.getDuration()
 		newAmplitude = np.max(newSound)
 			
 		# Create new sound object and return object
-		returnObj = SoundGenerator(waveType = "Join", frequency = newFrequency, amplitude = newAmplitude, duration = newDuration)
+		returnObj = SoundGenerator(waveType = "Join", frequency = newFrequency, amplitude = newAmplitude, duration = newDuration, clipMode = self.clipMode)
 
 		# Set sound value to newSound
 		returnObj.setSound(newSound)
 		return returnObj
 		
 	def __pow__(self, soundObj):
+		if self.isLazyWith(soundObj):
+			# Frequency does not matter here
+			returnObj = self.createLazySound("Combination", 100)
+			returnObj.setExpression(ModulationExpression(self.getExpression(), soundObj.getExpression(), self.clipMode))
+			return returnObj
+
 		# Figure out which is the longer sound
 		if len(self.sound) < len(soundObj.getSound()):
 			minSound = np.copy(self.getSound())
@@ -154,32 +156,94 @@ class SoundGenerator():
 		#newFrequency = int(self.getFrequency()) * int(soundObj.getFrequency()) / gcd(int(self.getFrequency()), int(soundObj.getFrequency()))
 		newDuration = float(len(maxSound))/SAMPLE_RATE
 		# Frequency does not matter here
-		minSoundObj = SoundGenerator(waveType = "Temp", frequency = 100, amplitude = np.max(minSound), duration = newDuration)
+		minSoundObj = SoundGenerator(waveType = "Temp", frequency = 100, amplitude = np.max(minSound), duration = newDuration, clipMode = self.clipMode)
 		minSoundObj.setSound(minSound)
-		maxSoundObj = SoundGenerator(waveType = "Temp", frequency = 100, amplitude = np.max(maxSound), duration = newDuration)
+		maxSoundObj = SoundGenerator(waveType = "Temp", frequency = 100, amplitude = np.max(maxSound), duration = newDuration, clipMode = self.clipMode)
 		maxSoundObj.setSound(maxSound)
 		return (minSoundObj * maxSoundObj)
 
 	def __str__(self):
 		return "WT: " + self.waveType + " F: " + str(self.frequency) + " A: " + str(self.amplitude) + " D: " + str(self.duration)
 
+	# Lazy results are evaluated here the first time their sound is needed
 	def getSound(self):
+		if self.expression is not None:
+			self.sound = self.expression.getResult()
+			self.expression = None
+			if len(self.sound) > 0:
+				self.amplitude = limitAmplitude(np.max(self.sound))
 		return self.sound
 
 	def setSound(self, soundArray):
 		self.sound = soundArray
+		self.expression = None
+
+	# Number of samples in the sound, without evaluating a pending expression
+	def getSoundLength(self):
+		if self.expression is not None:
+			return self.expression.length
+		return len(self.sound)
+
+	def getExpression(self):
+		if self.expression is not None:
+			return self.expression
+		return LeafExpression(self.sound)
+
+	def setExpression(self, expression):
+		self.expression = expression
+		self.duration   = float(expression.length) / SAMPLE_RATE
+
+	def setLazy(self, lazy):
+		self.lazy = lazy
+
+	def isLazyWith(self, soundObj):
+		return self.lazy or soundObj.lazy
+
+	# Frequency of two combined sounds: the LCM of both frequencies
+	def getCombinedFrequency(self, soundObj):
+		return int(self.getFrequency()) * int(soundObj.getFrequency()) / gcd(int(self.getFrequency()), int(soundObj.getFrequency()))
+
+	# Empty lazy sound whose samples come from an expression set afterwards
+	# Amplitude is only known once the expression is evaluated
+	def createLazySound(self, waveType, frequency):
+		return SoundGenerator(waveType = waveType, frequency = frequency, amplitude = 0.0, duration = 0.0, clipMode = self.clipMode, lazy = True)
+
+	# Build the expression graph for +, - and * between two sounds
+	# Follows combineSounds: the operation is applied on the start of the longer sound (which is the first operand for -)
+	def combineSoundsLazy(self, soundObj, operator, clipMode):
+		if self.getSoundLength() < soundObj.getSoundLength():
+			maxExpr, minExpr = soundObj.getExpression(), self.getExpression()
+		else:
+			maxExpr, minExpr = self.getExpression(), soundObj.getExpression()
+
+		if operator == '+':
+			expression = SumExpression([(1.0, maxExpr), (1.0, minExpr)], clipMode)
+		elif operator == '-':
+			expression = SumExpression([(1.0, maxExpr), (-1.0, minExpr)], clipMode)
+		elif operator == '*':
+			expression = ProductExpression(maxExpr, minExpr, clipMode)
+
+		returnObj = self.createLazySound("Combination", self.getCombinedFrequency(soundObj))
+		returnObj.setExpression(expression)
+		return returnObj
 
 	def getFrequency(self):
 		return self.frequency
 
 	def getDuration(self):
 		return self.duration
+
+	def getClipMode(self):
+		return self.clipMode
+
+	def setClipMode(self, clipMode):
+		self.clipMode = clipMode
 		
 	def shiftBy(self, numberOfSamples):
 		sound = self.getSound()
 		sound = np.roll(sound, numberOfSamples)
 		sound = np.append(np.zeros(numberOfSamples), sound[numberOfSamples:])
-		retSoundObj = SoundGenerator(self.waveType, self.frequency, self.amplitude, self.duration)
+		retSoundObj = SoundGenerator(self.waveType, self.frequency, self.amplitude, self.duration, self.clipMode)
 		retSoundObj.setSound(sound)
 		return retSoundObj
 if __name__ == "__main__":
@@ -201,3 +265,16 @@ if __name__ == "__main__":
 	modjoin1 = 	mod1 ** join1
 	writeWAVToFile(modjoin1, "modjoin1")
 
+	# Lazy mode gives the same samples as eager mode, including sums clipped before being added to (0.8 + 0.8 clips to 1.0)
+	loud  = SoundGenerator(waveType = "Constant", amplitude = 0.8, duration = 1.0)
+	quiet = SoundGenerator(waveType = "Constant", amplitude = -0.8, duration = 1.0)
+	eagerSum = (loud + loud) + quiet
+	for sound in [sin1, sqr1, sqr2, saw1, note1, note2, note3, note4, note5, mod1, loud, quiet]:
+		sound.setLazy(True)
+	lazyChord = note1 + note2 + note3 + (note4 * 0.5) + note5
+	lazyModjoin = mod1 ** (sin1 ^  sqr1 ^ sqr2 ^ saw1 ^ lazyChord)
+	lazySum = (loud + loud) + quiet
+	print("Lazy chord matches eager:", np.array_equal(chord1.getSound(), lazyChord.getSound()))
+	print("Lazy modulated join matches eager:", np.array_equal(modjoin1.getSound(), lazyModjoin.getSound()))
+	print("Lazy clipped sum matches eager:", np.array_equal(eagerSum.getSound(), lazySum.getSound()), eagerSum.getSound()[0], lazySum.getSound()[0])
+
@@ -0,0 +1,193 @@
+import bisect
+import numpy as np
+
+# End location of a score (in number of 8th notes): the latest end of its notes, the score is as long as its notes
+# Nothing is stored per note, the end is a running maximum while notes are added
+# and is worked out again from the columns of the NoteTable (notes) only after a note ending there is removed
+class TimelineIndex():
+	def __init__(self, notes):
+		self.notes = notes
+		self.end   = 0
+		self.stale = False # True when the end has to be worked out again from the notes
+
+	def add(self, start, end):
+		self.end = max(self.end, end)
+
+	def addMany(self, starts, ends):
+		if len(ends):
+			self.end = max(self.end, int(np.max(ends)))
+
+	# Called before the note is removed from the notes, the end is only worked out again when it is next asked for
+	def remove(self, start, end):
+		if end >= self.end:
+			self.stale = True
+
+	def clear(self):
+		self.end   = 0
+		self.stale = False
+
+	# Copy for a copy of the notes
+	def copy(self, notes):
+		timeline = TimelineIndex(notes)
+		timeline.end   = self.end
+		timeline.stale = self.stale
+		return timeline
+
+	# End location of the last note (0 for an empty score)
+	def getEnd(self):
+		if self.stale:
+			self.end   = int((self.notes.getColumn("start") + self.notes.getColumn("length")).max()) if len(self.notes) else 0
+			self.stale = False
+		return self.end
+
+# Merge (start, end) ranges into the sorted list of disjoint ranges covering the same locations
+def mergeRanges(ranges):
+	merged = []
+	for start, end in sorted(ranges):
+		if start >= end:
+			continue
+		if merged and start <= merged[-1][1]:
+			merged[-1][1] = max(merged[-1][1], end)
+		else:
+			merged.append([start, end])
+	return [tuple(r) for r in merged]
+
+# Number of notes a block of a NoteIntervalIndex is filled with, a block is split in two once it holds twice as many
+INTERVAL_BLOCK_SIZE = 128
+
+# Notes of one pitch of a NoteIntervalIndex, sorted by (start, note id) and cut in blocks of a few hundred notes
+# Only the note ids are stored, starts and ends are read from the columns of the NoteTable (notes) through the ids
+# The first (start, note id) and the latest end of every block are kept so adding or removing a note only changes one block,
+# and a lookup only looks inside the blocks still sounding at its location
+class IntervalBlocks():
+	def __init__(self, notes, noteIds):
+		self.notes     = notes
+		self.blocks    = [noteIds[first:first + INTERVAL_BLOCK_SIZE] for first in range(0, len(noteIds), INTERVAL_BLOCK_SIZE)] # Note ids of every block
+		self.firstKeys = [] # (start, note id) of the first note of every block
+		self.blockEnds = np.empty(len(self.blocks), dtype = np.int64) # Latest end of every block
+		for b, block in enumerate(self.blocks):
+			self.firstKeys.append(None)
+			self.setBlock(b, block)
+
+	# Start and end locations of notes given by their ids
+	def getSpans(self, noteIds):
+		rows = self.notes.getRows(noteIds)
+		starts = self.notes.getColumn("start")[rows]
+		return (starts, starts + self.notes.getColumn("length")[rows])
+
+	# Block a note belongs in: the last block starting at or before it
+	def findBlock(self, start, noteId):
+		return max(bisect.bisect_right(self.firstKeys, (start, noteId)) - 1, 0)
+
+	# Add a note already in the notes
+	def add(self, start, end, noteId):
+		b = self.findBlock(start, noteId)
+		block = self.blocks[b]
+		starts = self.getSpans(block)[0]
+		block = np.insert(block, int(np.count_nonzero((starts < start) | ((starts == start) & (block < noteId)))), noteId)
+		if len(block) < 2 * INTERVAL_BLOCK_SIZE:
+			self.setBlock(b, block)
+			return
+		# The block is full: it is split in two halves
+		self.blocks.insert(b + 1, None)
+		self.firstKeys.insert(b + 1, None)
+		self.blockEnds = np.insert(self.blockEnds, b + 1, 0)
+		self.setBlock(b, block[:INTERVAL_BLOCK_SIZE])
+		self.setBlock(b + 1, block[INTERVAL_BLOCK_SIZE:])
+
+	# Remove a note, before it is removed from the notes
+	def remove(self, start, noteId):
+		b = self.findBlock(start, noteId)
+		block = self.blocks[b]
+		if len(block) == 1:
+			del self.blocks[b]
+			del self.firstKeys[b]
+			self.blockEnds = np.delete(self.blockEnds, b)
+		else:
+			self.setBlock(b, np.delete(block, int(np.flatnonzero(block == noteId)[0])))
+
+	def setBlock(self, b, block):
+		starts, ends = self.getSpans(block)
+		self.blocks[b]    = block
+		self.firstKeys[b] = (int(starts[0]), int(block[0]))
+		self.blockEnds[b] = ends.max()
+
+	# Ids of the notes sounding at location x (start <= x < end)
+	def getCovering(self, x):
+		lastBlock = bisect.bisect_right(self.firstKeys, (x, float("inf")))
+		covering = []
+		for b in np.flatnonzero(self.blockEnds[:lastBlock] > x).tolist():
+			starts, ends = self.getSpans(self.blocks[b])
+			covering.extend(self.blocks[b][(starts <= x) & (ends > x)].tolist())
+		return covering
+
+	# Copy for a copy of the notes (with the same ids)
+	# Blocks are never changed in place, only replaced, so the copy shares them
+	def copy(self, notes):
+		intervals = IntervalBlocks(notes, [])
+		intervals.blocks    = list(self.blocks)
+		intervals.firstKeys = list(self.firstKeys)
+		intervals.blockEnds = self.blockEnds.copy()
+		return intervals
+
+	def __len__(self):
+		return sum(len(block) for block in self.blocks)
+
+# Index of the notes of every pitch by their start location, to find the notes covering a grid cell
+# The notes of every pitch are kept in IntervalBlocks: a lookup, an add or a remove only touches a few blocks
+# whatever the number of notes of the pitch or the length of its longest note
+# Notes are added after they are added to the NoteTable (notes) and removed before they are removed from it
+class NoteIntervalIndex():
+	def __init__(self, notes):
+		self.notes   = notes
+		self.pitches = {} # Pitch -> IntervalBlocks
+
+	def add(self, pitch, start, end, noteId):
+		intervals = self.pitches.get(pitch)
+		if intervals is None:
+			self.pitches[pitch] = IntervalBlocks(self.notes, np.array([noteId], dtype = np.int64))
+		else:
+			intervals.add(start, end, noteId)
+
+	# Add many notes at once (lists or arrays), the notes of every pitch are sorted once and cut in blocks again
+	def addMany(self, pitches, starts, ends, noteIds):
+		pitches = np.asarray(pitches, dtype = np.int64)
+		starts  = np.asarray(starts, dtype = np.int64)
+		noteIds = np.asarray(noteIds, dtype = np.int64)
+		order = np.lexsort((noteIds, starts, pitches))
+		pitches, starts, noteIds = pitches[order], starts[order], noteIds[order]
+		for group in np.split(np.arange(len(pitches)), np.flatnonzero(np.diff(pitches)) + 1) if len(pitches) else []:
+			pitch = int(pitches[group[0]])
+			pitchStarts, pitchIds = starts[group], noteIds[group]
+			if pitch in self.pitches:
+				intervals = self.pitches[pitch]
+				oldIds = np.concatenate(intervals.blocks)
+				pitchStarts = np.concatenate((intervals.getSpans(oldIds)[0], pitchStarts))
+				pitchIds    = np.concatenate((oldIds, pitchIds))
+				pitchIds    = pitchIds[np.lexsort((pitchIds, pitchStarts))]
+			self.pitches[pitch] = IntervalBlocks(self.notes, pitchIds)
+
+	def remove(self, pitch, start, end, noteId):
+		intervals = self.pitches[pitch]
+		intervals.remove(start, noteId)
+		if not intervals.blocks:
+			del self.pitches[pitch]
+
+	def clear(self):
+		self.pitches = {}
+
+	# Copy for a copy of the notes (with the same ids)
+	def copy(self, notes):
+		index = NoteIntervalIndex(notes)
+		index.pitches = dict((pitch, intervals.copy(notes)) for pitch, intervals in self.pitches.items())
+		return index
+
+	# Ids of the notes of a pitch sounding at location x (start <= x < end), in increasing order
+	def getCovering(self, pitch, x):
+		intervals = self.pitches.get(pitch)
+		if intervals is None:
+			return []
+		return sorted(intervals.getCovering(x))
+
+	def __len__(self):
+		return sum(len(intervals) for intervals in self.pitches.values())
@@ -1,13 +1,15 @@
 import numpy as np
-from scipy.io.wavfile import write
-from math import pi, sin, floor
-from fractions import gcd
-
-from SoundGenerator import *
+from math import floor
 
 SAMPLE_RATE = 11250 # Overall sampling rate
-TOTAL_WHOLE_NOTES = 16 # Maximum length of a music score
-TOTAL_EIGHTH_NOTES = TOTAL_WHOLE_NOTES * 8 # Maximum number of eigth notes in a music score
+TOTAL_WHOLE_NOTES = 16 # Default length of a music score in the editor (scores grow with their notes)
+TOTAL_EIGHTH_NOTES = TOTAL_WHOLE_NOTES * 8 # Default number of eigth notes in a music score
+
+# Clipping modes used when sounds are combined or mixed
+CLIP_HARD  = "Hard"  # Clamp samples to within -1.0 and 1.0
+CLIP_SOFT  = "Soft"  # Saturate samples smoothly towards -1.0 and 1.0 (tanh)
+CLIP_DEFER = "Defer" # Leave samples untouched so clipping happens once on the master bus
+CLIP_MODES = [CLIP_HARD, CLIP_SOFT, CLIP_DEFER]
 
 # Note characters without specific octyav number
 octave1Notes       = [ "C"  , "Db" , "D"  , "Eb" , "E"  , "F"  , "Gb"  , "G"  , "Ab" , "A"  , "Bb" , "B" ]
@@ -52,9 +54,26 @@ def getPitchChangedData(noteChar, octave, halfSteps):
 	return(newChar, newOctave)
 
 # Takes a SoundGenerator Object and writes the sound array as a wav file	
-def writeWAVToFile(soundObj, filename):
-	write(filename + ".wav", SAMPLE_RATE, soundObj.getSound())
+# sampleFormat is one of int16, int24, float32 or float64 (see WavWriter), the sound is converted chunk by chunk
+def writeWAVToFile(soundObj, filename, sampleFormat = "float64"):
+	from WavWriter import WavWriter
+	with WavWriter(filename + ".wav", SAMPLE_RATE, sampleFormat) as writer:
+		writer.writeSound(soundObj.getSound())
 
 # Limits the values in the sound array of a Sound Genrastor object to within -1.0 and 1.0	
 def limitAmplitude(amplitude):
 	return max(min(float(amplitude), 1.0), -1.0)
+
+# Limits all values in a sound array based on the clip mode in a single vectorized pass
+# If out is given the result is written into it (out may be the sound array itself)
+def clipSound(soundArray, clipMode = CLIP_HARD, out = None):
+	if clipMode == CLIP_HARD:
+		return np.clip(soundArray, -1.0, 1.0, out = out)
+	elif clipMode == CLIP_SOFT:
+		return np.tanh(soundArray, out = out)
+	elif clipMode == CLIP_DEFER:
+		if out is None or out is soundArray:
+			return soundArray
+		out[...] = soundArray
+		return out
+	raise ValueError("Unknown clip mode: " + str(clipMode))
\ No newline at end of file
@@ -0,0 +1,120 @@
+import numpy as np
+
+from Note import Note
+from Wavetable import renderOscillatorBank
+from UtilityFunctions import SAMPLE_RATE, getDurationOf8thNote
+from ScoreFile import WAVE_TYPES, getNoteValue
+from NoteTable import MAX_PITCH_INDEX
+from NoteCache import NoteCache
+
+# Number of samples (notes x samples) rendered as one 2D array, bounds the memory of a batch
+VOICE_BATCH_SAMPLES = 1 << 22
+
+# Number of samples all the voices of a bank may hold together, the least recently used voices are dropped beyond it
+VOICE_BANK_SAMPLES = 4 * VOICE_BATCH_SAMPLES
+
+# Longest voice a bank keeps, longer notes go through the oscillator on their own
+MAX_VOICE_SAMPLES = VOICE_BATCH_SAMPLES // 4
+
+# Frequency of every pitch index, the same values a Note gets
+PITCH_FREQUENCIES = np.array([Note(getNoteValue(p)).noteFrequency for p in range(MAX_PITCH_INDEX + 1)])
+
+# Index ranges [first, last) cutting notes with span lengths counts into batches of about batchSamples samples
+# Every batch holds at least one note
+def getBatchBounds(counts, batchSamples = VOICE_BATCH_SAMPLES):
+	if len(counts) == 0:
+		return []
+	ends = np.cumsum(counts)
+	cuts = np.searchsorted(ends, np.arange(batchSamples, int(ends[-1]), batchSamples), side = "right")
+	cuts = np.unique(np.concatenate(([0], cuts, [len(counts)])))
+	return list(zip(cuts[:-1].tolist(), cuts[1:].tolist()))
+
+# Renders the spans of many notes at once (the same samples as Note.getNoteSpan) instead of one Note at a time
+# Notes of the same shape (wave type and length) only differ in frequency and velocity: each shape is rendered as one 2D array
+# (notes x samples) from a bank of voices, with the velocities and the envelope curve applied by broadcasting
+# A voice is a periodic wave of one pitch with amplitude 1.0, a shorter note starts with the same samples as a longer one
+# so every pitch goes through the oscillator once, for the longest note of that wave type and pitch
+# The voices are held in a NoteCache bounded to VOICE_BANK_SAMPLES samples
+class VoiceBank():
+	def __init__(self, tempo, envelope, applyEnvelope):
+		self.lengthOf8     = float(getDurationOf8thNote(tempo))
+		self.envelope      = envelope
+		self.applyEnvelope = applyEnvelope
+		self.voices        = NoteCache(VOICE_BANK_SAMPLES * np.dtype(np.float64).itemsize) # (wave code, pitch) -> voice
+		self.voiceCounts   = {} # (wave code, pitch) -> number of samples the voice is rendered for (see reserve)
+
+	# Number of samples of a note of length 8th notes, before the envelope
+	def getSampleCount(self, length):
+		return int(length * self.lengthOf8 * SAMPLE_RATE)
+
+	# Note the longest note of every wave type and pitch of a score array (rows) so each voice is only rendered once
+	# Nothing is rendered here, voices are rendered the first time they are used
+	def reserve(self, rows):
+		lengths = np.unique(rows["length"])
+		sampleCounts = np.array([self.getSampleCount(length) for length in lengths.tolist()], dtype = np.int64)
+		counts = sampleCounts[np.searchsorted(lengths, rows["length"])]
+		periodic = (rows["wave"] != WAVE_TYPES.index("Noise")) & (counts <= MAX_VOICE_SAMPLES)
+		keys = rows["wave"][periodic].astype(np.int64) * (MAX_PITCH_INDEX + 1) + rows["pitch"][periodic]
+		longest = np.zeros(len(WAVE_TYPES) * (MAX_PITCH_INDEX + 1), dtype = np.int64)
+		np.maximum.at(longest, keys, counts[periodic])
+		for key in np.flatnonzero(longest).tolist():
+			voiceKey = divmod(key, MAX_PITCH_INDEX + 1)
+			self.voiceCounts[voiceKey] = max(self.voiceCounts.get(voiceKey, 0), int(longest[key]))
+
+	# Voice of a wave type and pitch with at least sampleCount samples (at most MAX_VOICE_SAMPLES)
+	def getVoice(self, wave, pitch, sampleCount):
+		key = (wave, pitch)
+		voice = self.voices.get(key)
+		if voice is None or len(voice) < sampleCount:
+			voice = self.renderVoice(wave, pitch, max(sampleCount, self.voiceCounts.get(key, 0)))
+			self.voices.put(key, voice)
+		return voice
+
+	# Voice of a wave type and pitch of sampleCount samples
+	def renderVoice(self, wave, pitch, sampleCount):
+		if WAVE_TYPES[wave] == "Constant":
+			return np.ones(sampleCount)
+		return renderOscillatorBank(WAVE_TYPES[wave], PITCH_FREQUENCIES[pitch:pitch + 1], sampleCount)[0]
+
+	# Spans of notes of one shape as a 2D array, one row per note
+	def renderShape(self, wave, length, pitches, velocities):
+		sampleCount = self.getSampleCount(length)
+		spanCount   = self.envelope.getEnvelopeLength(sampleCount) if self.applyEnvelope else sampleCount
+		if sampleCount == 0:
+			return np.zeros((len(pitches), spanCount))
+
+		spans = np.empty((len(pitches), spanCount))
+		if WAVE_TYPES[wave] == "Noise":
+			# Noise has no pitch and, as in SoundGenerator, is not scaled by the velocity
+			spans[:, :sampleCount] = np.random.uniform(-1, 1, (len(pitches), sampleCount))
+		else:
+			for row, pitch in enumerate(pitches.tolist()):
+				if sampleCount > MAX_VOICE_SAMPLES:
+					# Too long to keep in the bank, the note is rendered on its own
+					spans[row, :sampleCount] = self.renderVoice(wave, pitch, sampleCount)
+				else:
+					spans[row, :sampleCount] = self.getVoice(wave, pitch, sampleCount)[:sampleCount]
+			spans[:, :sampleCount] *= velocities[:, np.newaxis]
+
+		# As with Envelope.applyADSREnvelope the note is repeated to the length of the envelope
+		for offset in range(sampleCount, spanCount, sampleCount):
+			spans[:, offset:offset + sampleCount] = spans[:, :min(sampleCount, spanCount - offset)]
+		if self.applyEnvelope:
+			spans *= self.envelope.getADSRCurve(sampleCount)
+		return spans
+
+	# Spans of the notes of a score array, in the order of its rows
+	# The spans of notes of the same shape are rows of one array
+	def renderSpans(self, rows):
+		spans = [None] * len(rows)
+		if len(rows) == 0:
+			return spans
+
+		# Shape of every note as one number made of its wave code and length
+		shapes = rows["wave"].astype(np.int64) * (int(rows["length"].max()) + 1) + rows["length"]
+		order = np.argsort(shapes, kind = "stable")
+		for group in np.split(order, np.flatnonzero(np.diff(shapes[order])) + 1):
+			shapeSpans = self.renderShape(int(rows["wave"][group[0]]), int(rows["length"][group[0]]), rows["pitch"][group], rows["velocity"][group])
+			for i, span in zip(group.tolist(), shapeSpans):
+				spans[i] = span
+		return spans
@@ -0,0 +1,104 @@
+import numpy as np
+import struct
+
+from UtilityFunctions import SAMPLE_RATE
+
+# WAV format tags
+WAVE_FORMAT_PCM        = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+# Sample formats that can be written: (WAV format tag, bytes per sample)
+SAMPLE_FORMATS = {
+	"int16"   : (WAVE_FORMAT_PCM, 2),
+	"int24"   : (WAVE_FORMAT_PCM, 3),
+	"float32" : (WAVE_FORMAT_IEEE_FLOAT, 4),
+	"float64" : (WAVE_FORMAT_IEEE_FLOAT, 8),
+}
+
+# Number of samples converted at once when a whole sound is written
+WRITE_CHUNK_SIZE = 65536
+
+# Writes a WAV file block by block so the whole sound never has to be held in memory (or converted in one go)
+# sampleFormat - One of SAMPLE_FORMATS, float64 matches writeWAVToFile's historical output
+# dither       - Add triangular (TPDF) dither of +-1 LSB before rounding to an integer format
+# The header is written first with empty sizes and patched with the real sizes when the writer is closed
+class WavWriter():
+	def __init__(self, filename, sampleRate = SAMPLE_RATE, sampleFormat = "float64", dither = True, seed = 0):
+		if sampleFormat not in SAMPLE_FORMATS:
+			raise ValueError("Unknown sample format: " + str(sampleFormat))
+		self.filename     = filename
+		self.sampleRate   = int(sampleRate)
+		self.sampleFormat = sampleFormat
+		self.formatTag, self.sampleWidth = SAMPLE_FORMATS[sampleFormat] # Bytes per sample
+		self.dither       = dither
+		self.random       = np.random.RandomState(seed) # Seeded so the same sound always gives the same file
+		self.sampleCount  = 0
+		self.file         = open(filename, "wb")
+		self.writeHeader()
+
+	# RIFF header, fmt chunk and data chunk header
+	# Float samples need the fmt chunk extension (empty) and a fact chunk
+	def writeHeader(self):
+		dataBytes = self.sampleCount * self.sampleWidth
+		fmt = struct.pack("<HHIIHH", self.formatTag, 1, self.sampleRate, self.sampleRate * self.sampleWidth, self.sampleWidth, 8 * self.sampleWidth)
+		if self.formatTag == WAVE_FORMAT_IEEE_FLOAT:
+			chunks  = b"fmt " + struct.pack("<I", len(fmt) + 2) + fmt + struct.pack("<H", 0)
+			chunks += b"fact" + struct.pack("<II", 4, self.sampleCount)
+		else:
+			chunks  = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+		chunks += b"data" + struct.pack("<I", dataBytes)
+		# An odd sized data chunk is followed by a pad byte, counted in the RIFF size but not in the data size
+		self.file.write(b"RIFF" + struct.pack("<I", 4 + len(chunks) + dataBytes + dataBytes % 2) + b"WAVE" + chunks)
+
+	# Convert a block of samples (-1.0 to 1.0) to the bytes of the sample format
+	def encodeBlock(self, block):
+		if self.sampleFormat == "float64":
+			return np.asarray(block, dtype = "<f8").tobytes()
+		if self.sampleFormat == "float32":
+			return np.asarray(block, dtype = "<f4").tobytes()
+
+		# Integer formats: scale to full range, dither, round and clip in place on one array
+		fullScale = 2 ** (8 * self.sampleWidth - 1) - 1
+		samples = np.multiply(block, float(fullScale))
+		if self.dither:
+			samples += self.random.uniform(-0.5, 0.5, len(samples))
+			samples += self.random.uniform(-0.5, 0.5, len(samples))
+		np.rint(samples, out = samples)
+		np.clip(samples, -fullScale - 1, fullScale, out = samples)
+		if self.sampleWidth == 2:
+			return samples.astype("<i2").tobytes()
+		# 24 bit samples are the low 3 bytes of little endian 32 bit integers
+		return samples.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+
+	# Append a block of samples to the file
+	def writeBlock(self, block):
+		self.file.write(self.encodeBlock(block))
+		self.sampleCount += len(block)
+
+	# Write a whole sound array a chunk at a time so only one chunk is ever converted at once
+	def writeSound(self, sound):
+		for start in range(0, len(sound), WRITE_CHUNK_SIZE):
+			self.writeBlock(sound[start:start + WRITE_CHUNK_SIZE])
+
+	# Patch the header with the final sizes and close the file
+	def close(self):
+		if self.file is None:
+			return
+		if self.sampleCount * self.sampleWidth % 2:
+			self.file.write(b"\x00")
+		self.file.seek(0)
+		self.writeHeader()
+		self.file.close()
+		self.file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+# Takes an iterable of sample blocks (for example ScoreManager.generateBlocks) and writes them as a wav file as they come
+def writeWAVBlocksToFile(blocks, filename, sampleFormat = "float64"):
+	with WavWriter(filename + ".wav", sampleFormat = sampleFormat) as writer:
+		for block in blocks:
+			writer.writeBlock(block)
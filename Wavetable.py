@@ -0,0 +1,65 @@
+import numpy as np
+from math import pi
+
+from UtilityFunctions import SAMPLE_RATE
+
+# Number of samples in one cycle of a wavetable
+# High resolution so linear interpolation between table samples stays well below audible error
+WAVETABLE_SIZE = 8192
+
+# Process wide cache of wavetables, one per wave type, shared by every oscillator
+wavetableCache = {}
+
+# Return the wavetable for a wave type, computing it the first time it is asked for
+def getWavetable(waveType):
+	table = wavetableCache.get(waveType)
+	if table is None:
+		table = createWavetable(waveType)
+		table.setflags(write = False)
+		wavetableCache[waveType] = table
+	return table
+
+# Compute a single cycle of a wave type with amplitude 1.0
+# The table holds one extra guard sample equal to the first one so interpolation never has to wrap around
+def createWavetable(waveType):
+	phaseArray = np.arange(WAVETABLE_SIZE + 1) * (2 * pi / WAVETABLE_SIZE)
+	if  (waveType == "Sine"):
+		table = np.sin(phaseArray)
+	elif(waveType == "Square"):
+		# Positive half of the sine cycle is +1, negative half is -1
+		table = np.ones(WAVETABLE_SIZE + 1)
+		table[WAVETABLE_SIZE // 2:WAVETABLE_SIZE] = -1.0
+	elif(waveType == "Sawtooth"):
+		# Falls linearly from 1 to -1 over the cycle
+		table = 1 - phaseArray / pi
+	else:
+		raise ValueError("No wavetable for wave type: " + str(waveType))
+	table[WAVETABLE_SIZE] = table[0]
+	return table
+
+# Play a wavetable with a phase accumulator
+# Phase is measured in cycles (0.0 - 1.0) and advances by frequency / SAMPLE_RATE every sample
+# so the frequency stays exact whatever the length of a cycle in samples
+def renderOscillator(waveType, frequency, amplitude, sampleCount, startPhase = 0.0):
+	sound = renderOscillatorBank(waveType, [frequency], sampleCount, startPhase)[0]
+	sound *= amplitude
+	return sound
+
+# Play a wavetable at several frequencies at once with amplitude 1.0: one row of sampleCount samples per frequency
+# Every row holds the same samples renderOscillator gives for its frequency, before the amplitude is applied
+def renderOscillatorBank(waveType, frequencies, sampleCount, startPhase = 0.0):
+	table = getWavetable(waveType)
+
+	# Phase of every sample, scaled to a position in the table
+	position = np.arange(sampleCount, dtype = np.float64) * (np.asarray(frequencies, dtype = np.float64) / SAMPLE_RATE)[:, np.newaxis]
+	position += startPhase
+	np.mod(position, 1.0, out = position)
+	position *= WAVETABLE_SIZE
+
+	# Linear interpolation between the two nearest table samples
+	index = position.astype(np.intp)
+	position -= index
+	sound = table[index + 1] - table[index]
+	sound *= position
+	sound += table[index]
+	return sound